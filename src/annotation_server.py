@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:03:47 2026
+
+Long-running annotation service. The dictionary is loaded once and batches
+of articles are annotated over HTTP (TCP or Unix socket).
+
+cd mesinesp-baseline/src
+python new_detection_method.py serve -i ../data/DeCS_simple.tsv -c ../data/DeCS_simple.bin -e trie --port 8000
+
+POST /annotate  {"articles": [{"id", "abstractText"}, ...], "spans": false}
+             -> {"documents": [{"id", "labels"[, "spans"]}, ...]}
+GET  /stats     -> throughput, queue depth and aggregated metrics
+GET  /health    -> {"status": "ok"}
+Invalid requests get status 400 and failed annotations 500, with {"error"}.
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from utils.io_utils import prediction_codes
+from utils.metrics_utils import MetricsCollector
+from annotator import Annotator
+
+# Maximum size of a request body (bytes)
+MAX_BODY_SIZE = 64 << 20
+
+
+def check_articles(articles):
+    '''
+    DESCRIPTION: check that a request holds a list of articles with a string
+    or integer id and a string abstractText. Raises ValueError otherwise.
+    '''
+    if not isinstance(articles, list):
+        raise ValueError('articles must be a list')
+    for i, article in enumerate(articles):
+        if not isinstance(article, dict):
+            raise ValueError('article {} is not an object'.format(i))
+        if ('id' not in article) or ('abstractText' not in article):
+            raise ValueError('article {}: id and abstractText are required'.format(i))
+        if isinstance(article['id'], bool) or \
+           not isinstance(article['id'], (str, int)):
+            raise ValueError('article {}: id must be a string or an integer'.format(i))
+        if not isinstance(article['abstractText'], str):
+            raise ValueError('article {}: abstractText must be a string'.format(i))
+
+
+def format_document(_id, predictions, spans=False):
+    '''
+    DESCRIPTION: response record of a document.
+    '''
+    document = {'id': _id, 'labels': prediction_codes(predictions)}
+    if spans:
+        document['spans'] = [{'span': x[0], 'start': x[1], 'end': x[2],
+                              'code': x[-1]} for x in predictions]
+    return document
+
+
+class AnnotationService():
+    '''
+    DESCRIPTION: scan batches of articles with an Annotator.
+
+    Requests of all connections are put in one queue and scanned by a single
+    thread: scanning is CPU bound, so more threads would only compete for
+    the GIL. Run several services (one per core) to scale.
+    '''
+
+    def __init__(self, annotator):
+        self.annotator = annotator
+        self.queue = queue.Queue()
+        self.metrics = MetricsCollector()
+        self.lock = threading.Lock()
+        self.n_requests = 0
+        self.busy_seconds = 0.0
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, articles, spans=False):
+        '''
+        DESCRIPTION: queue a batch of articles.
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            its result is the list of response records of the articles.
+        '''
+        future = Future()
+        self.queue.put((articles, spans, future))
+        return future
+
+    def annotate(self, articles, spans=False):
+        '''
+        DESCRIPTION: queue a batch of articles and wait for its result.
+        '''
+        return self.submit(articles, spans).result()
+
+    def _run(self):
+        while True:
+            articles, spans, future = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            try:
+                documents = []
+                for article in articles:
+                    _id = article['id']
+                    doc_metrics = self.metrics.new_doc_metrics()
+                    predictions = self.annotator.annotate(article['abstractText'],
+                                                          doc_metrics)
+                    with self.lock:
+                        self.metrics.add_document(_id, doc_metrics)
+                    documents.append(format_document(_id, predictions, spans))
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(documents)
+            with self.lock:
+                self.n_requests = self.n_requests + 1
+                self.busy_seconds = self.busy_seconds + time.perf_counter() - start
+
+    def stats(self):
+        '''
+        DESCRIPTION: throughput and queue depth of the service.
+        '''
+        with self.lock:
+            aggregate = self.metrics.aggregate()
+            n_requests = self.n_requests
+            busy_seconds = self.busy_seconds
+        uptime = time.time() - self.start_time
+        return {'uptime_seconds': uptime,
+                'queue_depth': self.queue.qsize(),
+                'requests': n_requests,
+                'documents': aggregate['documents'],
+                'docs_per_sec': aggregate['documents'] / uptime if uptime > 0 else 0.0,
+                'busy_docs_per_sec': (aggregate['documents'] / busy_seconds
+                                      if busy_seconds > 0 else 0.0),
+                'metrics': aggregate}
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {'error': 'Not found: {}'.format(self.path)})
+
+    def do_POST(self):
+        if self.path != '/annotate':
+            self._send_json(404, {'error': 'Not found: {}'.format(self.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # rfile.read would wait for the client to close the connection
+            self.close_connection = True
+            self._send_json(400, {'error': 'Bad request: invalid Content-Length'})
+            return
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {'error': 'Request body too large'})
+            return
+        try:
+            request = json.loads(self.rfile.read(length))
+            if isinstance(request, list):
+                request = {'articles': request}
+            if not isinstance(request, dict):
+                raise ValueError('request must be an object or a list of articles')
+            if 'articles' not in request:
+                raise ValueError('articles are required')
+            articles = request['articles']
+            check_articles(articles)
+            spans = request.get('spans', False)
+            if not isinstance(spans, bool):
+                raise ValueError('spans must be true or false')
+        except ValueError as e:
+            self._send_json(400, {'error': 'Bad request: {}'.format(e)})
+            return
+        try:
+            documents = self.server.service.annotate(articles, spans)
+        except Exception as e:
+            # The connection is kept: the client gets the error
+            self._send_json(500, {'error': 'Annotation failed: {!r}'.format(e)})
+            return
+        self._send_json(200, {'documents': documents})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def make_server(service, host='127.0.0.1', port=8000, unix_socket=None,
+                quiet=True):
+    '''
+    DESCRIPTION: HTTP server of an AnnotationService, listening on a TCP
+    port or on a Unix socket. Every connection is handled in its own thread.
+    '''
+    if unix_socket is not None:
+        # Remove the socket of a previous run, but no other file
+        if os.path.exists(unix_socket):
+            if not stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+                raise ValueError('{} exists and is not a socket'.format(unix_socket))
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, AnnotationRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), AnnotationRequestHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def serve(tsv_path, min_upper, engine='window', artifact_path=None,
+          host='127.0.0.1', port=8000, unix_socket=None, quiet=True):
+    '''
+    DESCRIPTION: load the dictionary and serve requests until interrupted.
+    '''
+    service = AnnotationService(Annotator(tsv_path, artifact_path, engine,
+                                          min_upper))
+    server = make_server(service, host, port, unix_socket, quiet)
+    if unix_socket is not None:
+        print('Serving on unix socket {}'.format(unix_socket))
+    else:
+        print('Serving on http://{}:{}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.remove(unix_socket)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:20:36 2026
+
+In-process API of the detector. The dictionary is loaded once and texts are
+annotated without files nor subprocesses.
+
+from annotator import Annotator
+annotator = Annotator('../data/DeCS_simple.tsv', '../data/DeCS_simple.bin')
+annotator.annotate('Pacientes con diabetes mellitus tipo 2.')
+annotator.labels('Pacientes con diabetes mellitus tipo 2.')
+for _id, predictions in annotator.annotate_many(articles): ...
+"""
+
+from utils.app_specific_utils import (load_tsv_index, load_tsv_indexes,
+                                      set_stop_words)
+from utils.artifact_utils import load_dictionary
+from utils.general_utils import set_tokenizer
+from utils.io_utils import prediction_codes, prediction_codes_by_source
+from utils.matching_utils import NgramIndex, build_term_index
+from detect_annotations import find_annotations
+
+
+def load_index(tsv_path, min_upper, engine='window', artifact_path=None):
+    '''
+    DESCRIPTION: load the dictionary structures used by find_annotations,
+    from a compiled artifact if given or from the TSV otherwise. tsv_path 
+    may be a list of tuples (name, path) of several dictionaries, matched
+    at once (see load_tsv_indexes); they cannot be compiled.
+
+    Returns
+    -------
+    token2annot_ids: python dict
+    id2annot_info: list
+    term_index: python dict (trie), NgramIndex (hash) or None (window)
+    '''
+    if isinstance(tsv_path, str):
+        if artifact_path is not None:
+            return load_dictionary(tsv_path, min_upper, artifact_path, engine)
+        token2annot_ids, id2annot_info = load_tsv_index(tsv_path, min_upper)
+    elif artifact_path is not None:
+        raise ValueError('Compiled dictionaries hold one dictionary')
+    else:
+        token2annot_ids, id2annot_info = load_tsv_indexes(tsv_path, min_upper)
+    return (token2annot_ids, id2annot_info, 
+            build_term_index(id2annot_info, engine))
+
+
+class Annotator():
+    '''
+    DESCRIPTION: detector of the annotations of a dictionary in texts.
+
+    Parameters
+    ----------
+    tsv_path : str or list
+        path to input TSV with codes, or tuples (name, path) of several 
+        dictionaries matched at once. Their labels are then in the 
+        namespace of their dictionary (see load_tsv_indexes).
+    artifact_path : str
+        path to compiled dictionary. It is created or rebuilt if it is
+        missing or outdated. If None, the TSV is parsed.
+    engine : str
+        matching engine for multi-word annotations: 'window' (default, as
+        in the command line), 'trie' or 'hash'.
+    min_upper : int
+        minimum number of characters of a word to lowercase it.
+    tokenizer : str
+        tokenizer of input texts ('spacy' or 'regex'). The tokenizer is
+        global to the process (see set_tokenizer); None keeps the current
+        one.
+    stop_words : str
+        Spanish stop words ('bundled' or 'spacy'), global to the process
+        (see set_stop_words); None keeps the current ones.
+
+    Predictions are Predictions objects (see span_utils.py): they read as 
+    lists [span, off0, off1, label, code], sorted by span.
+    '''
+
+    def __init__(self, tsv_path, artifact_path=None, engine='window', min_upper=5,
+                 tokenizer=None, stop_words=None):
+        if engine not in ('window', 'trie', 'hash'):
+            raise ValueError('Unknown engine: {}'.format(engine))
+        if tokenizer is not None:
+            set_tokenizer(tokenizer)
+        if stop_words is not None:
+            set_stop_words(stop_words)
+        self.engine = engine
+        self.min_upper = min_upper
+        self.sources = (None if isinstance(tsv_path, str) 
+                        else [name for name, _ in tsv_path])
+        self.token2annot_ids, self.id2annot_info, self.term_trie = \
+            load_index(tsv_path, min_upper, engine, artifact_path)
+
+    @classmethod
+    def from_index(cls, token2annot_ids, id2annot_info, term_trie=None,
+                   min_upper=5):
+        '''
+        DESCRIPTION: build an Annotator from dictionary structures already
+        in memory (see load_tsv_index and build_term_index).
+        '''
+        annotator = cls.__new__(cls)
+        if term_trie is None:
+            annotator.engine = 'window'
+        elif isinstance(term_trie, NgramIndex):
+            annotator.engine = 'hash'
+        else:
+            annotator.engine = 'trie'
+        annotator.min_upper = min_upper
+        annotator.sources = None
+        annotator.token2annot_ids = token2annot_ids
+        annotator.id2annot_info = id2annot_info
+        annotator.term_trie = term_trie
+        return annotator
+
+    def annotate(self, text, metrics=None):
+        '''
+        DESCRIPTION: predictions of one text.
+
+        Parameters
+        ----------
+        text : str
+        metrics : dict
+            if given (see new_doc_metrics), it is filled with the metrics of
+            the text.
+
+        Returns
+        -------
+        predictions : Predictions
+        '''
+        return find_annotations(text, self.token2annot_ids, self.id2annot_info,
+                                self.min_upper, self.term_trie, metrics)
+
+    def labels(self, text):
+        '''
+        DESCRIPTION: unique codes of one text, in order of appearance.
+        '''
+        return prediction_codes(self.annotate(text))
+
+    def source_labels(self, text):
+        '''
+        DESCRIPTION: unique codes of one text found with every dictionary,
+        by dictionary name (only with several dictionaries).
+        '''
+        if self.sources is None:
+            raise ValueError('The annotator has one dictionary: use labels')
+        return prediction_codes_by_source(self.annotate(text), self.sources)
+
+    def annotate_many(self, articles):
+        '''
+        DESCRIPTION: lazily annotate an iterable of texts.
+
+        Parameters
+        ----------
+        articles : iterable
+            texts (str) or articles {"id", "abstractText"}. Texts get their
+            position as ID.
+
+        Yields
+        ------
+        _id : str or int
+        predictions : Predictions
+        '''
+        for i, article in enumerate(articles):
+            if isinstance(article, str):
+                yield i, self.annotate(article)
+            else:
+                yield article['id'], self.annotate(article['abstractText'])
+
+    def annotate_batch(self, articles):
+        '''
+        DESCRIPTION: annotate a list of texts or articles (see annotate_many).
+
+        Returns
+        -------
+        predictions : list
+            predictions of every text, in input order.
+        '''
+        return [predictions for _, predictions in self.annotate_many(articles)]
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:02:19 2026
+
+Pipelined execution of a run: reading, scanning and writing overlap.
+
+reader --queue--> scanner --queue--> writer
+
+The reader reads chunks of articles in a thread (decompression and file
+reads do not hold the event loop), the scanner sends them to an executor
+(one thread, or a pool of worker processes) and the writer writes the
+records of every chunk in a thread, in input order. Queues are bounded: a
+slow stage blocks the previous ones (backpressure) and memory stays
+bounded.
+"""
+
+import asyncio
+import concurrent.futures
+import gc
+import itertools
+import multiprocessing
+import time
+from utils.io_utils import iter_articles
+from utils.app_specific_utils import get_stop_words
+from utils.general_utils import get_tokenizer
+import detect_annotations
+from detect_annotations import CHUNK_SIZE, _init_worker, _scan_chunk
+
+# Default size (in chunks of CHUNK_SIZE articles) of the queues
+QUEUE_SIZE = 8
+
+
+class StageQueue():
+    '''
+    DESCRIPTION: bounded asyncio queue between two stages, with metrics:
+    items, maximum and mean depth (when items are put) and seconds the
+    producer waited for free space (backpressure) and the consumer waited
+    for items (starvation).
+    '''
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.queue = asyncio.Queue(maxsize)
+        self.n_items = 0
+        self.max_depth = 0
+        self.depth_sum = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    async def put(self, item):
+        start = time.perf_counter()
+        await self.queue.put(item)
+        self.put_wait = self.put_wait + time.perf_counter() - start
+        depth = self.queue.qsize()
+        self.n_items = self.n_items + 1
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_sum = self.depth_sum + depth
+
+    async def get(self):
+        start = time.perf_counter()
+        item = await self.queue.get()
+        self.get_wait = self.get_wait + time.perf_counter() - start
+        return item
+
+    def stats(self):
+        return {'maxsize': self.queue.maxsize,
+                'items': self.n_items,
+                'max_depth': self.max_depth,
+                'mean_depth': self.depth_sum / self.n_items if self.n_items else 0.0,
+                'put_wait_seconds': self.put_wait,
+                'get_wait_seconds': self.get_wait}
+
+
+async def read_stage(datapath, out_queue, executor, stats):
+    # Read chunks of (index, article) in a thread. None marks the end
+    loop = asyncio.get_running_loop()
+    articles = enumerate(iter_articles(datapath))
+    read_chunk = lambda: list(itertools.islice(articles, CHUNK_SIZE))
+    while True:
+        start = time.perf_counter()
+        chunk = await loop.run_in_executor(executor, read_chunk)
+        stats['seconds'] = stats['seconds'] + time.perf_counter() - start
+        if not chunk:
+            break
+        stats['articles'] = stats['articles'] + len(chunk)
+        await out_queue.put(chunk)
+    await out_queue.put(None)
+
+
+async def scan_stage(in_queue, out_queue, executor, profile, cache, checkpoint,
+                     stats):
+    # Send every chunk to the scan executor. Journaled and cached articles
+    # are not sent. The future of every chunk is queued in input order, so
+    # several chunks are scanned at the same time
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await in_queue.get()
+        if chunk is None:
+            break
+        items = []
+        for index, article in chunk:
+            _id = article['id']
+            txt = article['abstractText']
+            predictions = None
+            if checkpoint is not None:
+                predictions = checkpoint.get(index, _id, txt)
+            journaled = predictions is not None
+            if (predictions is None) and (cache is not None):
+                predictions = cache.get(txt)
+            items.append((index, _id, txt, predictions, journaled))
+        tasks = [(_id, txt if predictions is None else None)
+                 for _, _id, txt, predictions, _ in items]
+        stats['articles'] = stats['articles'] + sum(x[1] is not None for x in tasks)
+        future = loop.run_in_executor(executor, _scan_chunk, tasks, profile)
+        await out_queue.put((items, future))
+    await out_queue.put(None)
+
+
+async def write_stage(in_queue, writer, executor, metrics, cache, checkpoint,
+                      stats):
+    # Wait for the chunks in input order and write their records in a thread
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            break
+        items, future = item
+        start = time.perf_counter()
+        results = await future
+        stats['scan_wait_seconds'] = (stats['scan_wait_seconds'] +
+                                      time.perf_counter() - start)
+        records = []
+        for (index, _id, txt, cached, journaled), (predictions, doc_metrics) in \
+            zip(items, results):
+            if cached is not None:
+                predictions = cached
+            else:
+                predictions.txt = txt
+                if metrics is not None:
+                    metrics.add_document(_id, doc_metrics)
+                if cache is not None:
+                    cache.put(txt, predictions)
+            if (checkpoint is not None) and (not journaled):
+                checkpoint.record(index, _id, predictions)
+            stats['predictions'] = stats['predictions'] + len(predictions)
+            records.append((_id, predictions))
+        start = time.perf_counter()
+        await loop.run_in_executor(executor, write_records, writer, records)
+        stats['seconds'] = stats['seconds'] + time.perf_counter() - start
+        stats['articles'] = stats['articles'] + len(records)
+
+
+def write_records(writer, records):
+    for _id, predictions in records:
+        writer.write_predictions(_id, predictions)
+
+
+async def run_stages(datapath, writer, scan_executor, profile, metrics, cache,
+                     checkpoint, queue_size):
+    '''
+    DESCRIPTION: run the three stages. If a stage fails or the run is
+    cancelled, the other stages are cancelled and the error is raised.
+    '''
+    read_queue = StageQueue('read', queue_size)
+    scan_queue = StageQueue('scan', queue_size)
+    stats = {'read': {'articles': 0, 'seconds': 0.0},
+             'scan': {'articles': 0},
+             'write': {'articles': 0, 'seconds': 0.0, 'scan_wait_seconds': 0.0,
+                       'predictions': 0}}
+    # One thread for reading and one for writing
+    read_executor = concurrent.futures.ThreadPoolExecutor(1)
+    write_executor = concurrent.futures.ThreadPoolExecutor(1)
+    tasks = [asyncio.ensure_future(read_stage(datapath, read_queue,
+                                              read_executor, stats['read'])),
+             asyncio.ensure_future(scan_stage(read_queue, scan_queue,
+                                              scan_executor, profile, cache,
+                                              checkpoint, stats['scan'])),
+             asyncio.ensure_future(write_stage(scan_queue, writer,
+                                               write_executor, metrics, cache,
+                                               checkpoint, stats['write']))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Chunks already sent to the scan executor are not needed anymore
+        while not scan_queue.queue.empty():
+            item = scan_queue.queue.get_nowait()
+            if item is not None:
+                item[1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        read_executor.shutdown(wait=True)
+        write_executor.shutdown(wait=True)
+    stats['queues'] = {'read': read_queue.stats(), 'scan': scan_queue.stats()}
+    return stats
+
+
+def run_pipeline(datapath, writer, min_upper, token2annot_ids, id2annot_info,
+                 term_trie=None, workers=1, metrics=None, cache=None,
+                 checkpoint=None, queue_size=None):
+    '''
+    DESCRIPTION: annotate all the articles of datapath and write their codes
+    with writer, overlapping reading, scanning and writing. Same output as
+    writing the predictions of iter_annots in order.
+
+    Parameters
+    ----------
+    datapath : str
+        path to input articles (see iter_articles).
+    writer : AnnotationWriter or SourceWriter
+    min_upper, token2annot_ids, id2annot_info, term_trie :
+        dictionary structures (see detect_annots).
+    workers : int
+        number of processes scanning articles. With 1, articles are scanned
+        in one thread of this process.
+    metrics, cache, checkpoint :
+        see iter_annots. They are only used by the event loop thread.
+    queue_size : int
+        maximum number of chunks of CHUNK_SIZE articles in every queue. The 
+        scan queue also bounds the chunks being scanned. If None, 
+        QUEUE_SIZE or 2 per worker.
+
+    Returns
+    -------
+    stats : python dict
+        articles and seconds of every stage, number of predictions and
+        metrics of the queues (see StageQueue).
+    '''
+    if queue_size is None:
+        queue_size = max(QUEUE_SIZE, 2 * workers)
+    fork = False
+    if workers > 1:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            # See iter_annots_parallel
+            gc.collect()
+            gc.freeze()
+            fork = True
+        else:
+            ctx = multiprocessing.get_context()
+        scan_executor = concurrent.futures.ProcessPoolExecutor(
+            workers, ctx, initializer=_init_worker,
+            initargs=(token2annot_ids, id2annot_info, term_trie, min_upper,
+                      get_tokenizer(), get_stop_words()))
+    else:
+        _init_worker(token2annot_ids, id2annot_info, term_trie, min_upper,
+                     get_tokenizer(), get_stop_words())
+        scan_executor = concurrent.futures.ThreadPoolExecutor(1)
+    profile = None if metrics is None else metrics.profile
+
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(run_stages(datapath, writer, scan_executor, profile,
+                                       metrics, cache, checkpoint, queue_size))
+    finally:
+        scan_executor.shutdown(wait=True)
+        if workers <= 1:
+            detect_annotations._worker_dictionary = None
+        if fork:
+            gc.unfreeze()
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def pipeline_stats_report(stats):
+    '''
+    DESCRIPTION: text summary of the stats of run_pipeline.
+    '''
+    lines = ['Pipeline: {} articles in {:.3f}s'.format(stats['write']['articles'],
+                                                       stats['seconds']),
+             '  read   {:9.3f} s reading'.format(stats['read']['seconds']),
+             '  scan   {:9d} articles scanned'.format(stats['scan']['articles']),
+             '  write  {:9.3f} s writing, {:.3f} s waiting for scans'.format(
+                 stats['write']['seconds'], stats['write']['scan_wait_seconds'])]
+    for name, queue in stats['queues'].items():
+        lines.append('  {} queue: {} chunks, depth max {} mean {:.1f} (size {}), '
+                     'producer blocked {:.3f} s, consumer starved {:.3f} s'.format(
+                         name, queue['items'], queue['max_depth'],
+                         queue['mean_depth'], queue['maxsize'],
+                         queue['put_wait_seconds'], queue['get_wait_seconds']))
+    return '\n'.join(lines)
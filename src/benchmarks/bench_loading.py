@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:10:27 2026
+
+Benchmark of the dictionary loading paths: parse_tsv + format_input_info
+(pandas) against load_tsv_index (streaming). Reports time and peak traced
+memory of every path and checks that both build the same index.
+
+cd mesinesp-baseline/src
+python -m benchmarks.bench_loading -i ../data/DeCS_simple.tsv
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from utils.app_specific_utils import format_input_info, load_tsv_index, parse_tsv
+
+
+def pandas_path(tsv_path, min_upper):
+    (_, _, _, _, _, token2annot_ids,
+     id2annot_info) = format_input_info(parse_tsv(tsv_path), min_upper)
+    return token2annot_ids, id2annot_info
+
+
+def streaming_path(tsv_path, min_upper):
+    return load_tsv_index(tsv_path, min_upper)
+
+
+LOADERS = {'pandas': pandas_path, 'streaming': streaming_path}
+
+
+def time_loader(loader, tsv_path, min_upper, repeat):
+    '''
+    DESCRIPTION: run a loader repeat times. Time is the best run; memory is
+    measured in an extra run, since tracing slows it down.
+
+    Returns
+    -------
+    result : python dict
+        seconds and peak traced memory (MB).
+    index : tuple
+        token2annot_ids and id2annot_info built by the loader.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index = loader(tsv_path, min_upper)
+        times.append(time.perf_counter() - start)
+        del index
+    tracemalloc.start()
+    index = loader(tsv_path, min_upper)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(times), 'peak_mb': peak / (1 << 20)}, index
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description='dictionary loading benchmark')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path",
+                        help = "path to input TSV with codes")
+    parser.add_argument("-r", "--repeat", required = False, dest = "repeat",
+                        default = 3, type = int,
+                        help = "number of timed runs of every loader")
+    parser.add_argument("-o", "--out_path", required = False, dest = "out_path",
+                        default = None, help = "path to output JSON with results")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    min_upper = 5
+
+    results = {}
+    indexes = {}
+    for name, loader in LOADERS.items():
+        results[name], indexes[name] = time_loader(loader, args.tsv_path,
+                                                   min_upper, args.repeat)
+        print('{:10} {:8.3f} s  peak {:7.1f} MB'.format(
+            name, results[name]['seconds'], results[name]['peak_mb']))
+
+    results['speedup'] = results['pandas']['seconds'] / results['streaming']['seconds']
+    results['parity'] = indexes['pandas'] == indexes['streaming']
+    print('speedup {:.2f}x, same index: {}'.format(results['speedup'],
+                                                  results['parity']))
+
+    if args.out_path is not None:
+        with open(args.out_path, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:40:52 2026
+
+Per-stage benchmark of the detection pipeline: parse_tsv and
+format_input_info (pandas loading), load_tsv_index (streaming loading),
+build_term_index, format_text_info, scan_one_file and output writing.
+Reports docs/sec, p50/p99 latency per document and peak RSS, and compares
+them with a previous run.
+
+cd mesinesp-baseline/src
+python -m benchmarks.bench_pipeline -i ../data/DeCS_simple.tsv -n 500 -o bench.json
+python -m benchmarks.bench_pipeline -i ../data/DeCS_simple.tsv -n 500 --baseline bench.json
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from utils.app_specific_utils import (format_input_info, format_text_info,
+                                      load_tsv_index, parse_tsv)
+from utils.general_utils import set_tokenizer
+from utils.io_utils import AnnotationWriter, iter_articles, prediction_codes
+from utils.matching_utils import build_term_index
+from detect_annotations import scan_one_file
+from benchmarks.synthetic_corpus import generate_corpus, read_terms
+
+# Stages whose time is compared with the baseline
+TIMED_STAGES = ['parse_tsv', 'format_input_info', 'load_tsv_index',
+                'build_term_index', 'format_text_info', 'scan_one_file',
+                'output']
+
+
+def peak_rss_mb():
+    '''
+    DESCRIPTION: peak resident set size of the process, in MB.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+def percentile(values, p):
+    '''
+    DESCRIPTION: nearest-rank percentile of a list of values.
+    '''
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def stage_result(seconds, latencies=None):
+    '''
+    DESCRIPTION: metrics of a stage. latencies (per document, in seconds)
+    are given for the stages that process documents.
+    '''
+    result = {'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}
+    if latencies is not None:
+        result['docs_per_sec'] = len(latencies) / seconds if seconds > 0 else 0.0
+        result['p50_ms'] = percentile(latencies, 50) * 1000
+        result['p99_ms'] = percentile(latencies, 99) * 1000
+    return result
+
+
+def run_benchmark(tsv_path, articles, min_upper=5, engine='trie'):
+    '''
+    DESCRIPTION: time every stage of the pipeline.
+
+    Parameters
+    ----------
+    tsv_path : str
+        path to input TSV with codes.
+    articles : list
+        articles {"id", "abstractText"}.
+    min_upper : int
+    engine : str
+        'window', 'trie' or 'hash' (see argparser of new_detection_method.py).
+
+    Returns
+    -------
+    results : python dict
+        metrics of every stage.
+    '''
+    results = {}
+
+    # Pandas loading: same stages as older baselines
+    start = time.perf_counter()
+    df_annot = parse_tsv(tsv_path)
+    results['parse_tsv'] = stage_result(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    index_stats = {}
+    format_input_info(df_annot, min_upper, index_stats)
+    results['format_input_info'] = stage_result(time.perf_counter() - start)
+    results['format_input_info']['postings'] = index_stats['postings']
+    results['format_input_info']['pruning_ratio'] = index_stats['pruning_ratio']
+    del df_annot
+
+    # Streaming loading, used by the pipeline. Both build the same index
+    # (see bench_loading)
+    start = time.perf_counter()
+    index_stats = {}
+    token2annot_ids, id2annot_info = load_tsv_index(tsv_path, min_upper, 
+                                                    index_stats)
+    results['load_tsv_index'] = stage_result(time.perf_counter() - start)
+    results['load_tsv_index']['postings'] = index_stats['postings']
+    results['load_tsv_index']['pruning_ratio'] = index_stats['pruning_ratio']
+
+    term_trie = None
+    if engine != 'window':
+        start = time.perf_counter()
+        term_trie = build_term_index(id2annot_info, engine)
+        results['build_term_index'] = stage_result(time.perf_counter() - start)
+
+    # Warm up: the spaCy pipeline is built on the first text, a one-off
+    # cost that would otherwise be the p99 latency
+    if articles:
+        format_text_info(articles[0]['abstractText'], min_upper)
+    latencies = []
+    for article in articles:
+        start = time.perf_counter()
+        format_text_info(article['abstractText'], min_upper)
+        latencies.append(time.perf_counter() - start)
+    results['format_text_info'] = stage_result(sum(latencies), latencies)
+
+    latencies = []
+    outputs = []
+    for article in articles:
+        start = time.perf_counter()
+        _, final_annots = scan_one_file(article['abstractText'], article['id'],
+                                        token2annot_ids, id2annot_info, {}, 0,
+                                        min_upper, term_trie)
+        latencies.append(time.perf_counter() - start)
+        outputs.append((article['id'], final_annots[article['id']]))
+    results['scan_one_file'] = stage_result(sum(latencies), latencies)
+    results['scan_one_file']['predictions'] = sum(len(v) for _, v in outputs)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        latencies = []
+        with AnnotationWriter(os.path.join(tmp_dir, 'output_file.json')) as writer:
+            for _id, predictions in outputs:
+                start = time.perf_counter()
+                writer.write(_id, prediction_codes(predictions))
+                latencies.append(time.perf_counter() - start)
+    results['output'] = stage_result(sum(latencies), latencies)
+
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    '''
+    DESCRIPTION: compare the results with a previous run.
+
+    Parameters
+    ----------
+    results : python dict
+        output of run_benchmark.
+    baseline : python dict
+        output of run_benchmark of a previous run.
+    tolerance : float
+        allowed relative increase (0.2 = 20 %) of stage time, p99 latency and
+        peak RSS.
+
+    Returns
+    -------
+    regressions : list
+        description of every metric worse than allowed.
+    '''
+    regressions = []
+    for stage in TIMED_STAGES:
+        if (stage not in results) or (stage not in baseline):
+            continue
+        for metric in ('seconds', 'p99_ms'):
+            if metric not in results[stage]:
+                continue
+            new = results[stage][metric]
+            old = baseline[stage][metric]
+            if new > old * (1 + tolerance):
+                regressions.append('{} {}: {:.4f} -> {:.4f} (+{:.0%})'.format(
+                    stage, metric, old, new, new / old - 1 if old else math.inf))
+    new = max(r['peak_rss_mb'] for r in results.values())
+    old = max(r['peak_rss_mb'] for r in baseline.values())
+    if new > old * (1 + tolerance):
+        regressions.append('peak_rss_mb: {:.1f} -> {:.1f}'.format(old, new))
+    return regressions
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description='pipeline benchmark')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path",
+                        help = "path to input TSV with codes")
+    parser.add_argument("-d", "--datapath", required = False, dest = "datapath",
+                        default = None,
+                        help = "path to input JSON file with articles. If not " +
+                        "given, a synthetic corpus is generated")
+    parser.add_argument("-n", "--n_docs", required = False, dest = "n_docs",
+                        default = 200, type = int,
+                        help = "number of synthetic abstracts")
+    parser.add_argument("-l", "--doc_length", required = False, dest = "doc_length",
+                        default = 150, type = int,
+                        help = "mean number of words or terms per synthetic abstract")
+    parser.add_argument("--density", required = False, dest = "term_density",
+                        default = 0.2, type = float,
+                        help = "fraction of DeCS terms in synthetic abstracts")
+    parser.add_argument("--seed", required = False, dest = "seed",
+                        default = 0, type = int, help = "random seed")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "trie", choices = ["window", "trie", "hash"],
+                        help = "matching engine")
+    parser.add_argument("-t", "--tokenizer", required = False, dest = "tokenizer",
+                        default = "spacy", choices = ["spacy", "regex"],
+                        help = "tokenizer of input texts")
+    parser.add_argument("-o", "--out_path", required = False, dest = "out_path",
+                        default = None, help = "path to output JSON with results")
+    parser.add_argument("--baseline", required = False, dest = "baseline",
+                        default = None,
+                        help = "path to JSON with results of a previous run. " +
+                        "Exit with error if any stage is slower")
+    parser.add_argument("--tolerance", required = False, dest = "tolerance",
+                        default = 0.2, type = float,
+                        help = "allowed relative slowdown against the baseline")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    set_tokenizer(args.tokenizer)
+
+    if args.datapath is not None:
+        articles = list(iter_articles(args.datapath))
+    else:
+        articles = generate_corpus(read_terms(args.tsv_path), args.n_docs,
+                                   args.doc_length, args.term_density,
+                                   args.seed)['articles']
+
+    results = {'config': {'n_docs': len(articles),
+                          'datapath': args.datapath,
+                          'doc_length': args.doc_length,
+                          'term_density': args.term_density,
+                          'seed': args.seed,
+                          'engine': args.engine,
+                          'tokenizer': args.tokenizer},
+               'stages': run_benchmark(args.tsv_path, articles,
+                                       engine=args.engine)}
+
+    for stage, metrics in results['stages'].items():
+        line = '{:18} {:9.3f} s'.format(stage, metrics['seconds'])
+        if 'docs_per_sec' in metrics:
+            line = line + '  {:9.1f} docs/s  p50 {:8.3f} ms  p99 {:8.3f} ms'.format(
+                metrics['docs_per_sec'], metrics['p50_ms'], metrics['p99_ms'])
+        print(line + '  peak RSS {:7.1f} MB'.format(metrics['peak_rss_mb']))
+
+    if args.out_path is not None:
+        with open(args.out_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != results['config']:
+            print('WARNING: baseline was run with another configuration')
+        regressions = find_regressions(results['stages'], baseline['stages'],
+                                       args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
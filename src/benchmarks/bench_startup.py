@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:31:12 2026
+
+Cold-start benchmark: every run is a new Python process that imports the
+detector, loads the dictionary and annotates one document. Reports the
+median time of every phase, the heavy libraries imported by each one and
+checks the total (import + first document) against a budget.
+
+cd mesinesp-baseline/src
+python -m benchmarks.bench_startup -i ../data/DeCS_simple.tsv -c ../data/DeCS_simple.bin -t regex --budget 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Libraries that dominate the startup time when they are imported
+HEAVY_MODULES = ('spacy', 'pandas', 'numpy')
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code of every run. Times are measured in the new process
+CHILD = '''
+import sys, time
+start = time.perf_counter()
+import json
+config = json.loads(sys.argv[1])
+heavy = lambda: [m for m in config['heavy_modules'] if m in sys.modules]
+import new_detection_method
+from annotator import Annotator
+result = {'import_seconds': time.perf_counter() - start, 'import_modules': heavy()}
+t = time.perf_counter()
+annotator = Annotator(config['tsv_path'], config['artifact_path'], config['engine'],
+                      tokenizer=config['tokenizer'], stop_words=config['stop_words'])
+result['load_seconds'] = time.perf_counter() - t
+result['load_modules'] = heavy()
+t = time.perf_counter()
+annotator.annotate(config['text'])
+result['first_doc_seconds'] = time.perf_counter() - t
+result['first_doc_modules'] = heavy()
+print(json.dumps(result))
+'''
+
+PHASES = ('import', 'load', 'first_doc')
+
+TEXT = ('Estudio de la diabetes mellitus tipo 2 en pacientes con insuficiencia ' +
+        'renal crónica tratados con insulina en atención primaria.')
+
+
+def cold_start(config):
+    '''
+    DESCRIPTION: run the detector once in a new Python process.
+
+    Returns
+    -------
+    result : python dict
+        seconds and heavy modules imported of every phase, and seconds of
+        the whole process (including interpreter startup).
+    '''
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', CHILD, json.dumps(config)],
+                         cwd=SRC_DIR, stdout=subprocess.PIPE, check=True,
+                         universal_newlines=True).stdout
+    result = json.loads(out.strip().split('\n')[-1])
+    result['process_seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_benchmark(config, repeat):
+    '''
+    DESCRIPTION: median of repeat cold starts. The first run is discarded:
+    it may compile the artifact or the bytecode.
+    '''
+    cold_start(config)
+    runs = [cold_start(config) for _ in range(repeat)]
+    results = {}
+    for phase in PHASES:
+        results[phase] = {
+            'seconds': statistics.median(r[phase + '_seconds'] for r in runs),
+            'modules': runs[-1][phase + '_modules']}
+    results['process'] = {'seconds': statistics.median(r['process_seconds']
+                                                       for r in runs)}
+    results['cold_start'] = {'seconds': results['import']['seconds'] +
+                             results['first_doc']['seconds']}
+    return results
+
+
+def check_stop_words():
+    '''
+    DESCRIPTION: compare the bundled stop words with those of spaCy.
+
+    Returns
+    -------
+    missing, extra : list
+        spaCy stop words not bundled and bundled words not in spaCy.
+    '''
+    from spacy.lang.es import STOP_WORDS
+    from utils.stop_words import SPANISH_STOP_WORDS
+    return (sorted(STOP_WORDS - SPANISH_STOP_WORDS),
+            sorted(SPANISH_STOP_WORDS - STOP_WORDS))
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description='cold-start benchmark')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path",
+                        help = "path to input TSV with codes")
+    parser.add_argument("-c", "--compiled", required = False, dest = "artifact_path",
+                        default = None, help = "path to compiled dictionary")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "trie", choices = ["window", "trie", "hash"],
+                        help = "matching engine")
+    parser.add_argument("-t", "--tokenizer", required = False, dest = "tokenizer",
+                        default = "spacy", choices = ["spacy", "regex"],
+                        help = "tokenizer of input texts")
+    parser.add_argument("--stop_words", required = False, dest = "stop_words",
+                        default = "bundled", choices = ["bundled", "spacy"],
+                        help = "Spanish stop words")
+    parser.add_argument("-r", "--repeat", required = False, dest = "repeat",
+                        default = 5, type = int, help = "number of cold starts")
+    parser.add_argument("--budget", required = False, dest = "budget",
+                        default = None, type = float,
+                        help = "maximum seconds of import plus first document. " +
+                        "Exit with error if it is exceeded")
+    parser.add_argument("--check_stop_words", required = False,
+                        dest = "check_stop_words", action = "store_true",
+                        help = "compare the bundled stop words with spaCy ones")
+    parser.add_argument("-o", "--out_path", required = False, dest = "out_path",
+                        default = None, help = "path to output JSON with results")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    config = {'tsv_path': os.path.abspath(args.tsv_path),
+              'artifact_path': None if args.artifact_path is None
+              else os.path.abspath(args.artifact_path),
+              'engine': args.engine,
+              'tokenizer': args.tokenizer,
+              'stop_words': args.stop_words,
+              'heavy_modules': HEAVY_MODULES,
+              'text': TEXT}
+
+    results = {'config': config, 'phases': run_benchmark(config, args.repeat)}
+    for phase, metrics in results['phases'].items():
+        line = '{:10} {:8.3f} s'.format(phase, metrics['seconds'])
+        if 'modules' in metrics:
+            line = line + '  heavy modules: {}'.format(
+                ', '.join(metrics['modules']) or '-')
+        print(line)
+
+    failed = False
+    if args.check_stop_words:
+        missing, extra = check_stop_words()
+        results['stop_words'] = {'missing': missing, 'extra': extra}
+        print('stop words: {} missing from the bundled list, {} extra'.format(
+            len(missing), len(extra)))
+        failed = bool(missing or extra)
+
+    if args.budget is not None:
+        cold = results['phases']['cold_start']['seconds']
+        results['budget'] = args.budget
+        if cold > args.budget:
+            print('OVER BUDGET: {:.3f} s > {:.3f} s'.format(cold, args.budget))
+            failed = True
+
+    if args.out_path is not None:
+        with open(args.out_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 10:20:44 2026
+
+Benchmark of the tokenizers of utils.general_utils: speed (tokens/sec) and
+parity of the words used by format_text_info. The words of every tokenizer
+are also compared, in order, with spaCy ones on PARITY_CASES, fragments of
+real abstracts that synthetic corpora do not have. The script exits with
+error if they differ.
+
+cd mesinesp-baseline/src
+python -m benchmarks.bench_tokenizers -d /path/to/input/json_file.json
+"""
+
+import argparse
+import json
+import string
+import sys
+import time
+from spacy.lang.es import Spanish
+from utils import general_utils
+from utils.general_utils import (set_tokenizer, tokenize, tokenize_batch,
+                                 TOKENIZERS)
+from utils.io_utils import iter_articles
+
+# Fragments of real abstracts with tricky word boundaries: missing spaces
+# after a period, arithmetic, units, abbreviations, ranges, ellipsis...
+PARITY_CASES = [
+    'Los pacientes ingresaron en el hospital.Luego se les realizó una biopsia.',
+    'Se incluyeron 40 pacientes en el estudio.Los resultados fueron similares.',
+    'Se estudiaron las células.Además, se analizaron los tejidos.',
+    'Se midió el ácido.Ácido úrico y creatinina en suero.',
+    'La dosis fue de 3+4 mg/kg/día y la pauta 10*5 UI cada 8 h.',
+    'IMC ≥30 kg/m2, edad 18-65 años, HbA1c <7,0% (n=120; p<0,05).',
+    'El 45,3% (IC 95%: 40,1-50,2) presentaba HTA, DM2 y/o EPOC.',
+    'Se administró paracetamol (1 g/8 h) e ibuprofeno (400 mg).',
+    'Se observaron mejorías en EEUU.Los datos de la OMS, p. ej. en la UCI...',
+    'Tras 2^3 ciclos, la carga viral fue <50 copias/ml en el 90% de los casos…',
+    'Pacientes con VIH+ y/o VHC+ tratados con TAR (2014-2018).',
+    'Dr. García, et al. «Estudio multicéntrico» (Rev. Esp. Cardiol. 2019;72:1-8).',
+]
+
+
+def spacy_tokenize_uncached(text):
+    '''
+    DESCRIPTION: previous behavior of tokenize, building the spaCy pipeline
+    on every call.
+    '''
+    nlp = Spanish()
+    return [token.text for token in nlp(text)]
+
+
+def words_in_order(tokens):
+    '''
+    DESCRIPTION: words used by format_text_info, in text order: tokens
+    without initial and final punctuation, longer than 1 character.
+    '''
+    words = map(lambda x: x.strip(string.punctuation + ' '), tokens)
+    return list(filter(lambda x: len(x) > 1, words))
+
+
+def words_of_interest(tokens):
+    '''
+    DESCRIPTION: set of the words used by format_text_info.
+    '''
+    return set(words_in_order(tokens))
+
+
+def time_tokenizer(texts, tokenizer, batch=False):
+    '''
+    DESCRIPTION: tokenize all texts and measure the time.
+
+    Returns
+    -------
+    tokenized : list
+        list of tokens of every text.
+    elapsed : float
+        seconds.
+    '''
+    set_tokenizer(tokenizer)
+    start = time.perf_counter()
+    if batch:
+        tokenized = list(tokenize_batch(texts))
+    else:
+        tokenized = [tokenize(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    return tokenized, elapsed
+
+
+def parity(tokenized_ref, tokenized):
+    '''
+    DESCRIPTION: compare the words of interest of two tokenizations.
+
+    Returns
+    -------
+    docs_identical : float
+        fraction of texts with the same set of words.
+    words_jaccard : float
+        Jaccard index of the words of all texts.
+    examples : list
+        some words found only by one of them.
+    '''
+    identical = 0
+    intersection = 0
+    union = 0
+    examples = []
+    for tokens_ref, tokens in zip(tokenized_ref, tokenized):
+        words_ref = words_of_interest(tokens_ref)
+        words = words_of_interest(tokens)
+        identical = identical + (words_ref == words)
+        intersection = intersection + len(words_ref & words)
+        union = union + len(words_ref | words)
+        if (words_ref != words) & (len(examples) < 10):
+            examples.append([sorted(words_ref - words), sorted(words - words_ref)])
+    n = max(len(tokenized_ref), 1)
+    return identical / n, intersection / max(union, 1), examples
+
+
+def case_parity(tokenizer):
+    '''
+    DESCRIPTION: compare the words of PARITY_CASES (see words_in_order) with
+    spaCy ones.
+
+    Returns
+    -------
+    mismatches : list
+        [case, spaCy words, words] of every case with other words.
+    '''
+    set_tokenizer('spacy')
+    reference = [words_in_order(tokenize(text)) for text in PARITY_CASES]
+    set_tokenizer(tokenizer)
+    mismatches = []
+    for text, words_ref in zip(PARITY_CASES, reference):
+        words = words_in_order(tokenize(text))
+        if words != words_ref:
+            mismatches.append([text, words_ref, words])
+    return mismatches
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description='tokenizer benchmark')
+    parser.add_argument("-d", "--datapath", required = True, dest = "datapath",
+                        help = "path to input JSON file with articles")
+    parser.add_argument("-n", "--n_docs", required = False, dest = "n_docs",
+                        default = None, type = int,
+                        help = "maximum number of articles")
+    parser.add_argument("-o", "--out_path", required = False, dest = "out_path",
+                        default = None, help = "path to output JSON with results")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    texts = []
+    for article in iter_articles(args.datapath):
+        texts.append(article['abstractText'])
+        if (args.n_docs is not None) and (len(texts) >= args.n_docs):
+            break
+
+    runs = [('spacy_uncached', spacy_tokenize_uncached, False),
+            ('spacy', 'spacy', False),
+            ('spacy_pipe', 'spacy', True),
+            ('regex', 'regex', False)]
+    assert set(TOKENIZERS) <= set(name for name, _, _ in runs)
+
+    results = {'n_docs': len(texts), 'tokenizers': {}}
+    tokenized_ref = None
+    for name, tokenizer, batch in runs:
+        # New spaCy pipeline, so that its token cache is not shared by runs
+        general_utils._spacy_nlp = None
+        # Warm up (build spaCy pipeline)
+        time_tokenizer(texts[:1], tokenizer, batch)
+        tokenized, elapsed = time_tokenizer(texts, tokenizer, batch)
+        if tokenized_ref is None:
+            tokenized_ref = tokenized
+        n_tokens = sum(map(len, tokenized))
+        docs_identical, words_jaccard, examples = parity(tokenized_ref, tokenized)
+        results['tokenizers'][name] = {'seconds': elapsed,
+                                       'tokens': n_tokens,
+                                       'tokens_per_sec': n_tokens / elapsed,
+                                       'docs_identical_words': docs_identical,
+                                       'words_jaccard': words_jaccard,
+                                       'examples': examples}
+        print('{:15} {:10.0f} tokens/s  docs with identical words: {:6.1%}  word Jaccard: {:.4f}'.format(
+              name, n_tokens / elapsed, docs_identical, words_jaccard))
+
+    failed = False
+    results['parity_cases'] = {}
+    for name in TOKENIZERS:
+        mismatches = case_parity(name)
+        results['parity_cases'][name] = mismatches
+        print('{:15} parity cases with other words than spaCy: {}/{}'.format(
+              name, len(mismatches), len(PARITY_CASES)))
+        for text, words_ref, words in mismatches:
+            print('    {}\n        spacy: {}\n        {}: {}'.format(
+                  text, words_ref, name, words))
+        failed = failed or bool(mismatches)
+    set_tokenizer('spacy')
+
+    if args.out_path is not None:
+        with open(args.out_path, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if failed:
+        sys.exit(1)
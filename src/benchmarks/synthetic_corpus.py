@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:05:31 2026
+
+Synthetic MESINESP corpus: Spanish abstracts mixing filler words and DeCS
+terms, with controllable length and term density.
+
+cd mesinesp-baseline/src
+python -m benchmarks.synthetic_corpus -i ../data/DeCS_simple.tsv -o corpus.json -n 1000
+"""
+
+import argparse
+import json
+import random
+
+# Frequent words of Spanish biomedical abstracts
+FILLER_WORDS = ('el la los las de del en y a con por para que se su sus un una '
+                'como más entre fueron fue ha han es son según sin sobre este '
+                'esta estos paciente pacientes tratamiento estudio resultados '
+                'análisis células casos grupo datos años edad se observó '
+                'presenta presentaron mostraron obtenidos evaluar objetivo '
+                'métodos conclusiones significativa respectivamente total '
+                'mediante durante después antes muestra media clínica').split()
+PUNCTUATION = [',', ',', '.', ';', ':']
+
+
+def read_terms(tsv_path):
+    '''
+    DESCRIPTION: read the spans of a TSV with columns code and span.
+    '''
+    terms = []
+    with open(tsv_path, encoding='utf-8') as f:
+        next(f)
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2 and fields[-1]:
+                terms.append(fields[-1])
+    return terms
+
+
+def generate_abstract(rng, terms, n_words, term_density):
+    '''
+    DESCRIPTION: generate one abstract.
+
+    Parameters
+    ----------
+    rng : random.Random
+    terms : list
+        DeCS terms.
+    n_words : int
+        number of items (filler words or terms) of the abstract.
+    term_density : float
+        probability of every item being a DeCS term.
+
+    Returns
+    -------
+    text : str
+    '''
+    words = []
+    for _ in range(n_words):
+        if rng.random() < term_density:
+            term = rng.choice(terms)
+            r = rng.random()
+            if r < 0.1:
+                term = term.upper()
+            elif r < 0.3:
+                term = term[:1].upper() + term[1:]
+            words.append(term)
+        else:
+            words.append(rng.choice(FILLER_WORDS))
+        if rng.random() < 0.08:
+            words[-1] = words[-1] + rng.choice(PUNCTUATION)
+    return ' '.join(words)
+
+
+def generate_corpus(terms, n_docs, doc_length=150, term_density=0.2, seed=0):
+    '''
+    DESCRIPTION: generate a synthetic corpus in MESINESP format.
+
+    Parameters
+    ----------
+    terms : list
+        DeCS terms.
+    n_docs : int
+        number of abstracts.
+    doc_length : int
+        mean number of items per abstract (uniform between half and 1.5
+        times this value).
+    term_density : float
+        probability of every item being a DeCS term.
+    seed : int
+
+    Returns
+    -------
+    corpus : python dict
+        {"articles": [{"id", "abstractText"}, ...]}
+    '''
+    rng = random.Random(seed)
+    articles = []
+    for i in range(n_docs):
+        n_words = rng.randint(max(1, doc_length // 2), max(1, doc_length * 3 // 2))
+        articles.append({'id': 'synthetic-{}'.format(i),
+                         'abstractText': generate_abstract(rng, terms, n_words,
+                                                           term_density)})
+    return {'articles': articles}
+
+
+def argparser():
+    parser = argparse.ArgumentParser(description='generate synthetic corpus')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path",
+                        help = "path to input TSV with codes")
+    parser.add_argument("-o", "--out_path", required = True, dest = "out_path",
+                        help = "path to output JSON file")
+    parser.add_argument("-n", "--n_docs", required = False, dest = "n_docs",
+                        default = 1000, type = int, help = "number of abstracts")
+    parser.add_argument("-l", "--doc_length", required = False, dest = "doc_length",
+                        default = 150, type = int,
+                        help = "mean number of words or terms per abstract")
+    parser.add_argument("--density", required = False, dest = "term_density",
+                        default = 0.2, type = float,
+                        help = "fraction of DeCS terms among words")
+    parser.add_argument("--seed", required = False, dest = "seed",
+                        default = 0, type = int, help = "random seed")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    corpus = generate_corpus(read_terms(args.tsv_path), args.n_docs,
+                             args.doc_length, args.term_density, args.seed)
+    with open(args.out_path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f, ensure_ascii=False)
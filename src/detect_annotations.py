@@ -5,36 +5,46 @@ Created on Wed Mar 25 09:40:48 2020
 
 @author: antonio
 """
+import collections
+import gc
 import itertools
+import multiprocessing
 import os
 import time
-import json
+from utils.io_utils import iter_articles
 from utils.app_specific_utils import (format_text_info, store_prediction,
-                                      check_surroundings)
-from utils.general_utils import Flatten
+                                      check_surroundings, get_stop_words,
+                                      label_source, set_stop_words)
+from utils.matching_utils import find_term_matches
+from utils.span_utils import SpanSet, merge_predictions
+from utils.general_utils import (get_tokenizer, normalization_cache_stats,
+                                 set_tokenizer)
+from utils.metrics_utils import new_doc_metrics
 
 
-def detect_annots(datapath, min_upper, annot2code, file2annot_processed,
-                  file2annot, annot2label, annot2annot_processed):
+def detect_annots(datapath, min_upper, token2annot_ids, id2annot_info,
+                  term_trie=None):
     '''
     
     Parameters
     ----------
     datapath : str
-        path to folder with text files.
+        path to JSON file with articles ({"articles": [...]}) or to JSON Lines
+        file with one article per line. They may be compressed (.gz, .xz,
+        .bz2). Articles are read one at a time.
     min_upper : int
         minimum number of character to lowercase a word.
-    annot2code : dict
-        python dictionary relating every annotation in the input TSV with its
-        code.
-    file2annot_processed : dict
-        DESCRIPTION.
-    file2annot : dict
-        DESCRIPTION.
-    annot2label : dict
-        DESCRIPTION.
-    annot2annot_processed : dict
-        DESCRIPTION.
+    token2annot_ids : dict
+        inverted index relating every normalized token with the IDs of the
+        annotations that contain it (see format_input_info).
+    id2annot_info : list
+        information of every annotation, indexed by annotation ID (see 
+        format_input_info).
+    term_trie : dict or NgramIndex
+        if given, multi-word annotations are matched with this token trie 
+        (see build_term_trie) or n-gram index (see build_ngram_index) 
+        instead of checking the surroundings of every 
+        token.
 
     Returns
     -------
@@ -52,113 +62,231 @@ def detect_annots(datapath, min_upper, annot2code, file2annot_processed,
     
     final_annots = {}
     c = 0
-    json_object = json.load(open(datapath, 'r'))
-    
-    for article in json_object['articles']:
-        txt = article['abstractText']
-        _id = article['id']
-        print(article['id'])
-        c, final_annots = \
-            scan_one_file(txt,_id,file2annot_processed,annot2annot_processed,
-                          annot2label,annot2code,file2annot,final_annots,c,min_upper)
+    for _id, predictions in iter_annots(datapath, min_upper, token2annot_ids,
+                                        id2annot_info, term_trie):
+        final_annots[_id] = predictions
+        c = c + len(predictions)
 
     total_t = time.time() - start
     
     return total_t, final_annots, c
 
 
-def scan_one_file(txt, _id, file2annot_processed, annot2annot_processed, 
-                  annot2label, annot2code, file2annot, final_annotations, c, 
-                  min_upper=5):
-        
-    #### 0. Initialize, etc. ####
-    new_annots = []
-    pos_matrix = []
+def iter_annots(datapath, min_upper, token2annot_ids, id2annot_info,
+                term_trie=None, workers=1, metrics=None, cache=None,
+                checkpoint=None):
+    '''
+    DESCRIPTION: yield the predictions of every article as soon as it is 
+    scanned. Same parameters as detect_annots, plus:
+    workers : int
+        number of processes scanning articles. Results are yielded in input
+        order and are identical to the serial run.
+    metrics : MetricsCollector
+        if given, the metrics of every article are added to it (see 
+        metrics_utils.py).
+    cache : ResultCache
+        if given, articles whose text is in the cache are not scanned, and
+        the predictions of scanned articles are added to it (see 
+        cache_utils.py). Only scanned articles are added to metrics.
+    checkpoint : Checkpoint
+        if given, articles journaled by a previous run are not scanned, and
+        the predictions of the other articles are journaled (see 
+        checkpoint_utils.py).
 
-    #### 2. Format text information ####
-    words_final, words_processed2pos = format_text_info(txt, min_upper)
+    Yields
+    ------
+    _id : str
+        article ID.
+    predictions : Predictions
+        predictions of the article (see find_annotations).
+    '''
+    if workers > 1:
+        yield from iter_annots_parallel(datapath, min_upper, token2annot_ids,
+                                        id2annot_info, term_trie, workers,
+                                        metrics, cache, checkpoint)
+        return
+    
+    for index, article in enumerate(iter_articles(datapath)):
+        txt = article['abstractText']
+        _id = article['id']
+        if checkpoint is not None:
+            predictions = checkpoint.get(index, _id, txt)
+            if predictions is not None:
+                yield _id, predictions
+                continue
+        predictions = None if cache is None else cache.get(txt)
+        if predictions is None:
+            doc_metrics = None if metrics is None else metrics.new_doc_metrics()
+            _, final_annots = \
+                scan_one_file(txt,_id,token2annot_ids,id2annot_info,{},0,
+                              min_upper,term_trie,doc_metrics)
+            predictions = final_annots[_id]
+            if metrics is not None:
+                metrics.add_document(_id, doc_metrics)
+            if cache is not None:
+                cache.put(txt, predictions)
+        if checkpoint is not None:
+            checkpoint.record(index, _id, predictions)
+        yield _id, predictions
 
-    #### 3. Intersection ####
-    # Find words within annotations
-    annot_processed_other_files = file2annot_processed.values()
 
-    # Flatten results and get set of it
-    annotations_final = set(Flatten(annot_processed_other_files))
-    
-    # Generate candidates
-    words_in_annots = words_final.intersection(annotations_final)
+# Dictionary of the worker processes (set by _init_worker)
+_worker_dictionary = None
 
-    #### 4. For every token of the intersection, get all original 
-    #### annotations associated to it and all matches in text.
-    #### Then, check surroundings of all those matches to check if any
-    #### of the original annotations is in the text ####
-    for match in words_in_annots:
-
-        # Get annotations where this token is present
-        original_annotations = [k for k,v in annot2annot_processed.items() \
-                                if match in v]
-
-        # Get text locations where this token is present
-        match_text_locations = words_processed2pos[match]
-         
-        # For every original annotation where this token is present:
-        for original_annot in original_annotations:
-            original_label = annot2label[original_annot]
-            original_text_locations = words_processed2pos[match]
-            n_chars = len(original_annot)
-            n_words = len(original_annot.split())
-            
-            if len(original_annot.split()) > 1:
-                # For every match of the token in text, check its 
-                # surroundings and generate predictions
-                codes = annot2code[original_annot]
-                len_original = len(new_annots)
-                for span in match_text_locations:
-                    new_annots, pos_matrix = \
-                        check_surroundings(txt,span,original_annot,n_chars,
-                                           n_words,original_label,new_annots,
-                                           pos_matrix,min_upper,codes)
-                    if len(new_annots) != len_original:
-                        # Stop looking for the same code in more than one place
-                        break
-                    
-            # If original_annotation is just the token, no need to 
-            # check the surroundings
-            elif len(original_annot.split()) == 1:
-                len_original = len(new_annots)
-                for span in original_text_locations:
-                    # Check span is surrounded by spaces or punctuation signs &
-                    # span is not contained in a previously stored prediction
-                    if span[0] == 0:
-                        cond_a = True
-                    else:
-                        cond_a = txt[span[0]-1].isalnum() == False
-                    if span[1] == len(txt):
-                        cond_b = True
+# Number of articles sent to a worker in every task
+CHUNK_SIZE = 16
+
+
+def _init_worker(token2annot_ids, id2annot_info, term_trie, min_upper, 
+                 tokenizer, stop_words):
+    global _worker_dictionary
+    set_tokenizer(tokenizer)
+    set_stop_words(stop_words)
+    _worker_dictionary = (token2annot_ids, id2annot_info, term_trie, min_upper)
+
+
+def _scan_chunk(chunk, profile=None):
+    # profile is None without metrics, otherwise the profile mode of the
+    # MetricsCollector of the main process
+    token2annot_ids, id2annot_info, term_trie, min_upper = _worker_dictionary
+    results = []
+    for _id, txt in chunk:
+        if txt is None:
+            # Predictions found by the main process (see iter_annots_parallel)
+            results.append((None, None))
+            continue
+        doc_metrics = None if profile is None else new_doc_metrics(profile)
+        _, final_annots = \
+            scan_one_file(txt,_id,token2annot_ids,id2annot_info,{},0,
+                          min_upper,term_trie,doc_metrics)
+        predictions = final_annots[_id]
+        # Do not send the text back: the main process has it
+        predictions.txt = None
+        results.append((predictions, doc_metrics))
+    return results
+
+
+def iter_annots_parallel(datapath, min_upper, token2annot_ids, id2annot_info,
+                         term_trie=None, workers=2, metrics=None, cache=None,
+                         checkpoint=None):
+    '''
+    DESCRIPTION: scan articles in a pool of worker processes. Same parameters
+    and output as iter_annots.
+    
+    The dictionary is not sent with every task. With the fork start method 
+    workers share it copy-on-write with the main process; otherwise it is 
+    sent once per worker. Articles are sent in chunks of CHUNK_SIZE and at 
+    most 4 chunks per worker are in flight, so memory stays bounded.
+    The cache and the checkpoint are only used by the main process. Texts 
+    journaled, found in the cache or equal to a text in flight are not sent
+    to the workers.
+    '''
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        # Move the dictionary out of the generations tracked by the garbage
+        # collector: otherwise collections in the workers touch its objects
+        # and copy the shared memory pages
+        gc.collect()
+        gc.freeze()
+    else:
+        ctx = multiprocessing.get_context()
+    
+    # Cache keys of the texts in flight: number of later articles with the 
+    # same text and predictions (once available)
+    in_flight = {}
+    
+    def lookup(index, article):
+        # (index, id, text, cache key, cached predictions, journaled). 
+        # Predictions are None if the text must be scanned, and in_flight if
+        # the text is in flight
+        _id = article['id']
+        txt = article['abstractText']
+        if checkpoint is not None:
+            predictions = checkpoint.get(index, _id, txt)
+            if predictions is not None:
+                return index, _id, txt, None, predictions, True
+        if cache is None:
+            return index, _id, txt, None, None, False
+        key = cache.key(txt)
+        if key in in_flight:
+            in_flight[key][0] = in_flight[key][0] + 1
+            cache.hits = cache.hits + 1
+            return index, _id, txt, key, in_flight, False
+        predictions = cache.get(txt)
+        if predictions is None:
+            in_flight[key] = [0, None]
+        return index, _id, txt, key, predictions, False
+    
+    articles = itertools.starmap(lookup, enumerate(iter_articles(datapath)))
+    chunks = iter(lambda: list(itertools.islice(articles, CHUNK_SIZE)), [])
+    
+    pool = ctx.Pool(workers, initializer=_init_worker, 
+                    initargs=(token2annot_ids, id2annot_info, term_trie, 
+                              min_upper, get_tokenizer(), get_stop_words()))
+    profile = None if metrics is None else metrics.profile
+    
+    def submit(chunk):
+        tasks = [(_id, txt if cached is None else None) 
+                 for _, _id, txt, _, cached, _ in chunk]
+        return chunk, pool.apply_async(_scan_chunk, (tasks, profile))
+    
+    def finished_chunk(chunk, async_result):
+        # Yield the results of a chunk and add them to metrics, cache and
+        # checkpoint
+        for (index, _id, txt, key, cached, journaled), (predictions, doc_metrics) in \
+            zip(chunk, async_result.get()):
+            if journaled:
+                yield _id, cached
+                continue
+            if cached is in_flight:
+                # Same text as a previous article
+                predictions = in_flight[key][1]
+                in_flight[key][0] = in_flight[key][0] - 1
+                if in_flight[key][0] == 0:
+                    del in_flight[key]
+            elif cached is not None:
+                predictions = cached
+            else:
+                predictions.txt = txt
+                if metrics is not None:
+                    metrics.add_document(_id, doc_metrics)
+                if cache is not None:
+                    cache.put(txt, predictions)
+                    if in_flight[key][0] == 0:
+                        del in_flight[key]
                     else:
-                        cond_b = txt[span[1]].isalnum() == False
+                        in_flight[key][1] = predictions
+            if checkpoint is not None:
+                checkpoint.record(index, _id, predictions)
+            yield _id, predictions
+    
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(submit(chunk))
+            # Yield finished chunks in input order
+            while len(pending) >= 4 * workers:
+                yield from finished_chunk(*pending.popleft())
+        while pending:
+            yield from finished_chunk(*pending.popleft())
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        if ctx.get_start_method() == 'fork':
+            gc.unfreeze()
 
-                        
-                    if ((cond_a & cond_b) &
-                        (not any([(item[0]<=span[0]) & (span[1]<=item[1]) 
-                                  for item in pos_matrix]))):
-                        
-                        # STORE PREDICTION and eliminate old predictions
-                        # contained in the new one.
-                        codes = annot2code[original_annot]
-                        new_annots, pos_matrix = \
-                            store_prediction(pos_matrix,new_annots,span[0],
-                                             span[1],original_label,
-                                             original_annot,txt,codes)
-                        if len(new_annots) != len_original:
-                            # Stop looking for the same code in more than one 
-                            # place
-                            break
 
-                
-    ## 4. Remove duplicates ##
-    new_annots.sort()
-    new_annots_no_duplicates = list(k for k,_ in itertools.groupby(new_annots))
+def scan_one_file(txt, _id, token2annot_ids, id2annot_info, final_annotations,
+                  c, min_upper=5, term_trie=None, metrics=None):
+    '''
+    DESCRIPTION: find the annotations of the dictionary in one text (see 
+    find_annotations), store them in final_annotations[_id] and add their 
+    number to c.
+    '''
+    new_annots_no_duplicates = find_annotations(txt, token2annot_ids, 
+                                                id2annot_info, min_upper, 
+                                                term_trie, metrics)
     
     ## 5. Check new annotations are not already annotated in their own ann
     '''
@@ -180,4 +308,177 @@ def scan_one_file(txt, _id, file2annot_processed, annot2annot_processed,
     c = c + len(new_annots_no_duplicates)
     final_annotations[_id] = new_annots_no_duplicates
     
-    return c, final_annotations
\ No newline at end of file
+    return c, final_annotations
+
+
+def find_annotations(txt, token2annot_ids, id2annot_info, min_upper=5, 
+                     term_trie=None, metrics=None):
+    '''
+    DESCRIPTION: find the annotations of the dictionary in one text.
+
+    Parameters
+    ----------
+    txt : str
+    token2annot_ids, id2annot_info, term_trie : 
+        dictionary structures (see detect_annots).
+    min_upper : int
+    metrics : dict
+        if given (see new_doc_metrics), it is filled with the counters and 
+        the time of every stage of this text.
+
+    Returns
+    -------
+    predictions : Predictions
+        sorted predictions [span, off0, off1, label, code], without 
+        duplicates (see span_utils.py).
+    '''
+        
+    #### 0. Initialize, etc. ####
+    # Predictions sorted by span, for logarithmic containment checks. With 
+    # several source dictionaries (see load_tsv_indexes), the predictions of
+    # every source are stored apart: they never contain those of another
+    source2annots = {}
+    label2annots = {}
+    n_checked = 0
+    n_surroundings = 0
+    n_hits = 0
+    if metrics is not None:
+        normalization_start = normalization_cache_stats()['total']
+    t_start = time.perf_counter()
+
+    #### 1. Find multi-word annotations in one pass (trie or hash engine) ####
+    if term_trie is not None:
+        annot_id2spans = find_term_matches(txt, term_trie, min_upper)
+    t_trie = time.perf_counter()
+
+    #### 2. Format text information ####
+    words_final, words_processed2pos = format_text_info(txt, min_upper)
+    t_format = time.perf_counter()
+
+    #### 3. Intersection ####
+    # Generate candidates: words of the text present in the inverted index.
+    # Sort them so that predictions do not depend on set ordering.
+    words_in_annots = sorted(words_final.intersection(token2annot_ids))
+
+    #### 4. For every token of the intersection, get all original 
+    #### annotations associated to it and all matches in text.
+    #### Then, check surroundings of all those matches to check if any
+    #### of the original annotations is in the text ####
+    #### Multi-word annotations are visited first: a single-word annotation
+    #### stops at its first hit, so it must not be stored inside a longer
+    #### annotation that would remove it afterwards (its occurrences inside
+    #### stored annotations are skipped) ####
+    for single_word in (False, True):
+        for match in words_in_annots:
+
+            # Get text locations where this token is present
+            match_text_locations = words_processed2pos[match]
+             
+            # For every original annotation where this token is present:
+            annot_ids = token2annot_ids[match]
+            if not single_word:
+                n_checked = n_checked + len(annot_ids)
+                if (metrics is not None) and ('annot_checks' in metrics):
+                    metrics['annot_checks'].update(annot_ids)
+            for annot_id in annot_ids:
+                (original_annot, original_label, codes, n_chars, n_words, 
+                 original_annot_processed) = id2annot_info[annot_id]
+                if (n_words == 1) != single_word:
+                    continue
+                new_annots = label2annots.get(original_label)
+                if new_annots is None:
+                    new_annots = source2annots.setdefault(
+                        label_source(original_label), SpanSet())
+                    label2annots[original_label] = new_annots
+                original_text_locations = match_text_locations
+            
+                if (n_words > 1) & (term_trie is not None):
+                    # Positions of the annotation were already found in text
+                    len_original = len(new_annots)
+                    for off0, off1 in annot_id2spans.get(annot_id, []):
+                        if not new_annots.contains(off0, off1):
+                            new_annots = \
+                                store_prediction(new_annots,off0,off1,
+                                                 original_label,original_annot,
+                                                 txt,codes)
+                        if len(new_annots) != len_original:
+                            # Stop looking for the same code in more than one place
+                            n_hits = n_hits + 1
+                            break
+
+                elif n_words > 1:
+                    # For every match of the token in text, check its 
+                    # surroundings and generate predictions
+                    len_original = len(new_annots)
+                    for span in match_text_locations:
+                        n_surroundings = n_surroundings + 1
+                        new_annots = \
+                            check_surroundings(txt,span,original_annot,n_chars,
+                                               n_words,original_label,new_annots,
+                                               min_upper,codes,
+                                               original_annot_processed)
+                        if len(new_annots) != len_original:
+                            # Stop looking for the same code in more than one place
+                            n_hits = n_hits + 1
+                            break
+                    
+                # If original_annotation is just the token, no need to 
+                # check the surroundings
+                elif n_words == 1:
+                    len_original = len(new_annots)
+                    for span in original_text_locations:
+                        # Check span is surrounded by spaces or punctuation signs &
+                        # span is not contained in a previously stored prediction
+                        if span[0] == 0:
+                            cond_a = True
+                        else:
+                            cond_a = txt[span[0]-1].isalnum() == False
+                        if span[1] == len(txt):
+                            cond_b = True
+                        else:
+                            cond_b = txt[span[1]].isalnum() == False
+
+                        
+                        if ((cond_a & cond_b) &
+                            (not new_annots.contains(span[0], span[1]))):
+                        
+                            # STORE PREDICTION and eliminate old predictions
+                            # contained in the new one.
+                            new_annots = \
+                                store_prediction(new_annots,span[0],
+                                                 span[1],original_label,
+                                                 original_annot,txt,codes)
+                            if len(new_annots) != len_original:
+                                # Stop looking for the same code in more than one 
+                                # place
+                                n_hits = n_hits + 1
+                                break
+
+    t_match = time.perf_counter()
+                
+    ## 4. Remove duplicates ##
+    new_annots_no_duplicates = merge_predictions(txt, source2annots.values())
+    t_end = time.perf_counter()
+    
+    if metrics is not None:
+        metrics['tokens'] = sum(map(len, words_processed2pos.values()))
+        metrics['unique_tokens'] = len(words_final)
+        metrics['candidate_tokens'] = len(words_in_annots)
+        metrics['annotations_checked'] = n_checked
+        metrics['check_surroundings_calls'] = n_surroundings
+        metrics['hits'] = n_hits
+        metrics['misses'] = n_checked - n_hits
+        metrics['predictions'] = len(new_annots_no_duplicates)
+        normalization_end = normalization_cache_stats()['total']
+        metrics['normalization_hits'] = (normalization_end['hits'] - 
+                                         normalization_start['hits'])
+        metrics['normalization_misses'] = (normalization_end['misses'] - 
+                                           normalization_start['misses'])
+        seconds = metrics['seconds']
+        seconds['trie_matching'] = t_trie - t_start
+        seconds['format_text_info'] = t_format - t_trie
+        seconds['matching'] = t_match - t_format
+        seconds['dedupe'] = t_end - t_match
+        seconds['total'] = t_end - t_start
+    
+    return new_annots_no_duplicates
@@ -8,52 +8,232 @@ OUTPUT_TSV
 """
 
 import os
-from utils.app_specific_utils import (format_input_info, parse_tsv)
-from utils.general_utils import argparser   
-from detect_annotations import detect_annots
-import json
+import sys
+import time
+from utils.app_specific_utils import (index_stats_report, load_tsv_index,
+                                      load_tsv_indexes, set_stop_words)
+from utils.general_utils import (argparser, compile_argparser, merge_argparser,
+                                 serve_argparser, shard_argparser, 
+                                 update_argparser, work_argparser,
+                                 normalization_cache_stats, set_tokenizer)
+from utils.matching_utils import build_term_index
+from utils.artifact_utils import compile_dictionary, load_dictionary
+from utils.io_utils import AnnotationWriter, SourceWriter, output_file_name
+from utils.metrics_utils import MetricsCollector
+from utils.cache_utils import ResultCache, cache_fingerprint
+from utils.checkpoint_utils import Checkpoint
+from detect_annotations import iter_annots
 
 
 if __name__ == '__main__':
     
     min_upper = 5 # minimum number of characters a string must have to lowercase it
 
+    ######## COMPILE SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'compile'):
+        tsv_path, artifact_path = compile_argparser(sys.argv[2:])
+        print('\n\nCompiling dictionary...\n\n')
+        index_stats = {}
+        compile_dictionary(tsv_path, min_upper, artifact_path, 
+                           index_stats=index_stats)
+        print(index_stats_report(index_stats))
+        print('\n\nFINISHED!')
+        sys.exit(0)
+
+    ######## UPDATE SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'update'):
+        tsv_path, artifact_path, delta_path, out_tsv_path = \
+            update_argparser(sys.argv[2:])
+        from utils.update_utils import update_dictionary
+        print('\n\nUpdating dictionary...\n\n')
+        fingerprint, summary = update_dictionary(tsv_path, artifact_path, 
+                                                 delta_path, min_upper, 
+                                                 out_tsv_path)
+        print('Annotations added: {}, removed: {}, recoded: {}, ignored rows: {}'.format(
+            summary['added'], summary['removed'], summary['recoded'], 
+            summary['ignored']))
+        print('Dictionary fingerprint: {}'.format(fingerprint))
+        print('\n\nFINISHED!')
+        sys.exit(0)
+
+    ######## SERVE SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'serve'):
+        (tsv_path, artifact_path, engine, tokenizer, host, port, unix_socket,
+         verbose) = serve_argparser(sys.argv[2:])
+        from annotation_server import serve
+        set_tokenizer(tokenizer)
+        print('\n\nLoading dictionary...\n\n')
+        serve(tsv_path, min_upper, engine, artifact_path, host, port, 
+              unix_socket, not verbose)
+        sys.exit(0)
+
+    ######## SHARD SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'shard'):
+        datapath, shard_dir, n_shards, compression = shard_argparser(sys.argv[2:])
+        from utils.shard_utils import split_corpus
+        print('\n\nSplitting corpus...\n\n')
+        manifest = split_corpus(datapath, shard_dir, n_shards, compression)
+        print('{} articles in {} shards'.format(manifest['n_articles'], 
+                                                manifest['n_shards']))
+        print('\n\nFINISHED!')
+        sys.exit(0)
+
+    ######## WORK SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'work'):
+        (shard_dir, tsv_path, artifact_path, engine, tokenizer, workers, 
+         worker_id, stale_after) = work_argparser(sys.argv[2:])
+        from annotator import load_index
+        from utils.shard_utils import work_shards
+        set_tokenizer(tokenizer)
+        print('\n\nLoading dictionary...\n\n')
+        token2annot_ids, id2annot_info, term_trie = \
+            load_index(tsv_path, min_upper, engine, artifact_path)
+        annotate = lambda datapath, checkpoint: iter_annots(
+            datapath, min_upper, token2annot_ids, id2annot_info, term_trie, 
+            workers, checkpoint=checkpoint)
+        print('\n\nAnnotating shards...\n\n')
+        annotated = work_shards(shard_dir, annotate, 
+                                cache_fingerprint(tsv_path, min_upper, engine, 
+                                                  tokenizer),
+                                worker_id, stale_after)
+        print('Shards annotated by this worker: {}'.format(len(annotated)))
+        print('\n\nFINISHED!')
+        sys.exit(0)
+
+    ######## MERGE SUBCOMMAND ########
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'merge'):
+        shard_dir, out_path, output_format, compression = \
+            merge_argparser(sys.argv[2:])
+        from utils.shard_utils import merge_shards
+        print('\n\nMerging shards...\n\n')
+        report = merge_shards(shard_dir, 
+                              os.path.join(out_path, output_file_name(
+                                  output_format, compression)),
+                              output_format)
+        print('{} articles from {} shards'.format(report['articles'], 
+                                                  report['shards']))
+        if report['duplicate_ids']:
+            print('WARNING: {} article IDs appear more than once: {}'.format(
+                len(report['duplicate_ids']), 
+                ', '.join(map(str, list(report['duplicate_ids'])[:10]))))
+        print('\n\nFINISHED!')
+        sys.exit(0)
+
     ######## Define paths ########   
     print('\n\nParsing script arguments...\n\n')
-    datapath, tsv_path, out_path = argparser()
+    (datapath, tsv_path, out_path, engine, artifact_path, output_format, 
+     compression, workers, tokenizer, stop_words, metrics_path, profile, 
+     cache_path, cache_size, checkpoint_path, checkpoint_every, async_pipeline, 
+     queue_size) = argparser()
+    set_tokenizer(tokenizer)
+    set_stop_words(stop_words)
     
-    ######## GET ANN INFORMATION ########    
-    # Get DataFrame
-    print('\n\nObtaining original annotations...\n\n')
-    df_annot = parse_tsv(tsv_path)
+    if artifact_path is not None:
+        ######## LOAD COMPILED DICTIONARY ########
+        print('\n\nLoading compiled dictionary...\n\n')
+        token2annot_ids, id2annot_info, term_trie = \
+            load_dictionary(tsv_path, min_upper, artifact_path, engine)
+    elif isinstance(tsv_path, str):
+        ######## GET AND FORMAT ANN INFORMATION ########    
+        print('\n\nObtaining original annotations...\n\n')
+        index_stats = {}
+        token2annot_ids, id2annot_info = load_tsv_index(tsv_path, min_upper, 
+                                                        index_stats)
+        print(index_stats_report(index_stats))
+    else:
+        ######## GET AND FORMAT ANN INFORMATION OF EVERY DICTIONARY ########
+        print('\n\nObtaining original annotations...\n\n')
+        index_stats = {}
+        token2annot_ids, id2annot_info = load_tsv_indexes(tsv_path, min_upper,
+                                                          index_stats)
+        for name, stats in index_stats.items():
+            print('{}:\n{}'.format(name, index_stats_report(stats)))
+    if artifact_path is None:
+        if engine != 'window':
+            print('\n\nBuilding annotation {}...\n\n'.format(
+                'trie' if engine == 'trie' else 'n-gram index'))
+        term_trie = build_term_index(id2annot_info, engine)
     
-    ######## FORMAT ANN INFORMATION #########
-    print('\n\nFormatting original annotations...\n\n')
-    (file2annot, file2annot_processed, annot2label, 
-     annot2annot_processed, annot2code) = format_input_info(df_annot, min_upper)
-    
-    ######## FIND MATCHES IN TEXT ########
+    ######## FIND MATCHES IN TEXT AND WRITE OUTPUT ########
+    # Every document is written as soon as it is scanned
     print('\n\nFinding new annotations...\n\n')
-    time_, final_annotations, c = detect_annots(datapath, min_upper, annot2code,
-                                                file2annot_processed, file2annot,
-                                                annot2label, annot2annot_processed)
+    start = time.time()
+    c = 0
+    if isinstance(tsv_path, str):
+        writer = AnnotationWriter(os.path.join(out_path, output_file_name(
+            output_format, compression)), output_format)
+    else:
+        # One output per dictionary, in a folder with its name
+        out_files = {}
+        for name, _ in tsv_path:
+            os.makedirs(os.path.join(out_path, name), exist_ok=True)
+            out_files[name] = os.path.join(out_path, name, output_file_name(
+                output_format, compression))
+        writer = SourceWriter(out_files, output_format)
+    metrics = None
+    if (metrics_path is not None) or profile:
+        metrics = MetricsCollector(metrics_path, profile)
+    cache = None
+    if cache_path is not None:
+        cache = ResultCache(cache_path, 
+                            cache_fingerprint(tsv_path, min_upper, engine, 
+                                              tokenizer),
+                            cache_size)
+    checkpoint = None
+    if checkpoint_path is not None:
+        checkpoint = Checkpoint(checkpoint_path, 
+                                cache_fingerprint(tsv_path, min_upper, engine,
+                                                  tokenizer),
+                                checkpoint_every)
+        if checkpoint.discarded:
+            print('Discarding checkpoint: written with another dictionary ' +
+                  'or configuration')
+        if len(checkpoint) > 0:
+            print('Resuming: {} articles already scanned'.format(len(checkpoint)))
+    # The output file is always written from the first article, so a resumed
+    # run writes the same bytes as an uninterrupted one
+    pipeline_stats = None
+    with writer:
+        if async_pipeline:
+            from async_pipeline import run_pipeline
+            pipeline_stats = run_pipeline(datapath, writer, min_upper, 
+                                          token2annot_ids, id2annot_info, 
+                                          term_trie, workers, metrics, cache,
+                                          checkpoint, queue_size)
+            c = pipeline_stats['write']['predictions']
+        else:
+            for _id, predictions in iter_annots(datapath, min_upper, 
+                                                token2annot_ids, id2annot_info,
+                                                term_trie, workers, metrics, 
+                                                cache, checkpoint):
+                c = c + len(predictions)
+                # Store only codes
+                writer.write_predictions(_id, predictions)
+    time_ = time.time() - start
+    if pipeline_stats is not None:
+        from async_pipeline import pipeline_stats_report
+        print(pipeline_stats_report(pipeline_stats))
+    if metrics is not None:
+        metrics.close()
+    if checkpoint is not None:
+        # The output is complete
+        checkpoint.remove()
+    if cache is not None:
+        cache.close()
+        cache_stats = cache.stats()
+        print('Cache: {} hits, {} misses (hit rate {:.1%}), {} evictions, {} entries'.format(
+            cache_stats['hits'], cache_stats['misses'], cache_stats['hit_rate'],
+            cache_stats['evictions'], cache_stats['entries']))
     
+    if workers <= 1:
+        # With workers, every process has its own caches (see --metrics)
+        normalization_stats = normalization_cache_stats()['total']
+        print('Normalization cache: {} hits, {} misses (hit rate {:.1%}), {} entries'.format(
+            normalization_stats['hits'], normalization_stats['misses'],
+            normalization_stats['hit_rate'], normalization_stats['entries']))
     print('Elapsed time: {}s'.format(round(time_, 3)))
     print('Number of suggested annotations: {}'.format(c))
-           
-    ######### WRITE OUTPUT ###########
-    # Store only codes
-    for k,v in final_annotations.items():
-        final_annotations[k] = list(set(map(lambda x: x[-1], v)))
-        
-    # Write output
-    json_array = []
-    for k, v in final_annotations.items():
-        json_array.append({'id': k, 'labels': v})
-    out = {}
-    out['documents'] = json_array
-    
-    with open(os.path.join(out_path, 'output_file.json'), 'w') as my_file:
-        json.dump(out, my_file)
+    if profile:
+        print('\n\n' + metrics.report_profile(id2annot_info))
     
     print('\n\nFINISHED!')
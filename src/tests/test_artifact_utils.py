@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 12:41:19 2026
+
+Compiled dictionary artifacts
+"""
+
+import pytest
+from utils.artifact_utils import (ARTIFACT_MAGIC, is_current_artifact,
+                                  load_dictionary)
+
+MIN_UPPER = 5
+
+
+@pytest.fixture
+def tsv_path(tmp_path):
+    path = tmp_path / 'dict.tsv'
+    path.write_text('code\tspan\n1\tcélulas\n2\tcélulas madre\n',
+                    encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('content', [b'code\tspan\n1\tcelulas\n',
+                                     b'{"articles": []}',
+                                     ARTIFACT_MAGIC + b' x y\n'])
+def test_other_files_are_not_overwritten(tmp_path, tsv_path, content):
+    artifact_path = tmp_path / 'dict.bin'
+    artifact_path.write_bytes(content)
+    with pytest.raises(ValueError):
+        load_dictionary(tsv_path, MIN_UPPER, str(artifact_path))
+    assert artifact_path.read_bytes() == content
+
+
+def test_stale_artifact_is_rebuilt(tmp_path, tsv_path):
+    artifact_path = str(tmp_path / 'dict.bin')
+    load_dictionary(tsv_path, MIN_UPPER, artifact_path)
+    assert is_current_artifact(tsv_path, MIN_UPPER, artifact_path)
+    with open(tsv_path, 'a', encoding='utf-8') as f:
+        f.write('3\tmadre\n')
+    assert not is_current_artifact(tsv_path, MIN_UPPER, artifact_path)
+    _, id2annot_info, _ = load_dictionary(tsv_path, MIN_UPPER, artifact_path)
+    assert len(id2annot_info) == 3
+    assert is_current_artifact(tsv_path, MIN_UPPER, artifact_path)
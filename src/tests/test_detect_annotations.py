@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 11:02:47 2026
+
+Predictions of find_annotations
+"""
+
+import pytest
+from annotator import Annotator
+from utils.general_utils import set_tokenizer
+
+MIN_UPPER = 5
+
+
+def annotator_of(tmp_path, rows, engine):
+    set_tokenizer('regex')
+    tsv_path = str(tmp_path / 'dict.tsv')
+    with open(tsv_path, 'w', encoding='utf-8') as f:
+        f.write('code\tspan\n' + ''.join('{}\t{}\n'.format(code, span)
+                                         for code, span in rows))
+    return Annotator(tsv_path, None, engine, MIN_UPPER)
+
+
+@pytest.mark.parametrize('engine', ['window', 'trie', 'hash'])
+def test_term_inside_longer_term_and_alone(tmp_path, engine):
+    # The first occurrence of "células" is inside "células madre": the
+    # standalone one must be found
+    annotator = annotator_of(tmp_path, [(1, 'células'), (2, 'células madre'),
+                                        (3, 'madre')], engine)
+    text = ('Se estudian las células madre y también las células de otro ' +
+            'tipo en pacientes.')
+    assert annotator.annotate(text) == [
+        ['células', 44, 51, 'DeCS', 1],
+        ['células madre', 16, 29, 'DeCS', 2]]
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 12:20:36 2026
+
+Tokenizers of general_utils
+"""
+
+import pytest
+from utils.general_utils import regex_tokenize
+
+
+@pytest.mark.parametrize('text, tokens', [
+    ('hospital.Luego', ['hospital', '.', 'Luego']),
+    ('células.Además', ['células', '.', 'Además']),
+    ('ácido.Ácido', ['ácido', '.', 'Ácido']),
+    ('EEUU.Los', ['EEUU.Los']),
+    ('pH7.4', ['pH7.4']),
+    ('3+4', ['3', '+', '4']),
+    ('10*5', ['10', '*', '5']),
+    ('3+-4', ['3', '+', '-4']),
+    ('a+b', ['a+b']),
+    ('dolor...Luego', ['dolor', '...', 'Luego']),
+    ('a..b', ['a', '..', 'b']),
+])
+def test_regex_tokenize_infixes(text, tokens):
+    # Same tokens as spaCy Spanish tokenizer
+    assert regex_tokenize(text) == tokens
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:14:08 2026
+
+An updated compiled dictionary must be the one compiled from the updated TSV
+"""
+
+import pytest
+from annotator import Annotator
+from utils.artifact_utils import read_artifact
+from utils.general_utils import set_tokenizer
+from utils.update_utils import read_delta, update_dictionary
+
+MIN_UPPER = 5
+
+TEXTS = ['Se estudian las células madre y también las células de otro tipo ' +
+         'en pacientes.',
+         'La madre soltera y la madre de las células madre.']
+
+
+def write_tsv(path, rows, header='code\tspan'):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(header + '\n' + ''.join('\t'.join(map(str, row)) + '\n'
+                                        for row in rows))
+
+
+def updated_and_fresh(tmp_path, rows, delta_rows, engine):
+    # Annotators of the updated artifact and of a fresh compile of the
+    # updated TSV
+    set_tokenizer('regex')
+    tsv_path = str(tmp_path / 'dict.tsv')
+    artifact_path = str(tmp_path / 'dict.bin')
+    delta_path = str(tmp_path / 'delta.tsv')
+    write_tsv(tsv_path, rows)
+    write_tsv(delta_path, delta_rows, 'action\tcode\tspan')
+    Annotator(tsv_path, artifact_path, engine)
+    update_dictionary(tsv_path, artifact_path, delta_path, MIN_UPPER)
+    return (Annotator(tsv_path, artifact_path, engine),
+            Annotator(tsv_path, None, engine))
+
+
+def annotations(annotator):
+    # Annotations in ID order and the index by annotation, without the IDs
+    # of removed annotations
+    id2annot_info = annotator.id2annot_info
+    alive = [info for info in id2annot_info if info is not None]
+    index = dict((token, [id2annot_info[x][0] for x in annot_ids])
+                 for token, annot_ids in annotator.token2annot_ids.items())
+    return alive, index
+
+
+OVERLAPPING = [(1, 'células'), (2, 'células madre'), (3, 'madre'),
+               (4, 'madre soltera')]
+
+DELTAS = [
+    [('recode', 9, 'células')],
+    [('remove', 1, 'células')],
+    [('add', 5, 'células'), ('add', 6, 'madre de')],
+    [('remove', 3, 'madre'), ('add', 7, 'madre'), ('recode', 8, 'madre soltera')],
+    [('add', 5, 'otro tipo'), ('remove', 5, 'otro tipo'), ('add', 6, 'tipo')],
+]
+
+
+@pytest.mark.parametrize('engine', ['window', 'trie'])
+@pytest.mark.parametrize('delta_rows', DELTAS)
+def test_update_equals_fresh_compile(tmp_path, delta_rows, engine):
+    rows = OVERLAPPING + [(1, 'células')]
+    updated, fresh = updated_and_fresh(tmp_path, rows, delta_rows, engine)
+    assert annotations(updated) == annotations(fresh)
+    for text in TEXTS:
+        assert updated.annotate(text) == fresh.annotate(text)
+
+
+def test_non_integer_code_in_integer_dictionary(tmp_path):
+    with pytest.raises(ValueError):
+        updated_and_fresh(tmp_path, OVERLAPPING, [('add', 'D0001', 'tipo')],
+                          'window')
+
+
+def test_string_codes_become_integers(tmp_path):
+    updated, fresh = updated_and_fresh(tmp_path, OVERLAPPING + [('D1', 'tipo')],
+                                       [('remove', 'D1', 'tipo')], 'window')
+    assert annotations(updated) == annotations(fresh)
+    assert read_artifact(str(tmp_path / 'dict.bin'))['id2annot_info'][0][2] == [1]
+
+
+def test_read_delta(tmp_path):
+    delta_path = tmp_path / 'delta.tsv'
+    delta_path.write_bytes(b'action\tcode\tspan\r\nadd\t1\tc\xc3\xa9lulas\r\n')
+    assert read_delta(str(delta_path)) == [('add', '1', 'células')]
+    delta_path.write_bytes(b'')
+    assert read_delta(str(delta_path)) == []
@@ -7,10 +7,13 @@ Created on Wed Jan 15 18:24:28 2020
 OUTPUT_TSV
 """
 
-import pandas as pd
+import csv
 import string
-from spacy.lang.es import STOP_WORDS
-from utils.general_utils import remove_accents, adjacent_combs, strip_punct, normalize_str, tokenize
+import sys
+from utils.stop_words import SPANISH_STOP_WORDS
+from utils.general_utils import (remove_accents, adjacent_combs, strip_punct,
+                                 normalize_span, normalize_str, normalize_word, 
+                                 tokenize, token_offsets)
 import re
 
 
@@ -81,23 +84,72 @@ def normalize_tokens(token_spans, min_upper):
     token_span_processed2token_span: python dict 
         It relates the normalized token combinations with the original unnormalized ones.
     '''
-    token_span2token_span = dict(zip(token_spans, token_spans))
+    # Lowercase, remove whitespaces, punctuation and accents. Token 
+    # combinations normalized in the same way keep the last one
+    token_span_processed2token_span = dict((normalize_span(k, min_upper), k) 
+                                           for k in token_spans)
     
-    # Lowercase
-    token_span_lower2token_span = dict((k.lower(), v) if len(k) > min_upper else 
-                                       (k,v) for k,v in token_span2token_span.items())
+    return token_span_processed2token_span
 
-    # Remove whitespaces
-    token_span_bs2token_span = dict((re.sub('\s+', ' ', k).strip(), v) for k,v 
-                                    in token_span_lower2token_span.items())
 
-    # Remove punctuation
-    token_span_punc2token_span = dict((k.translate(str.maketrans('', '', string.punctuation)), v) for k,v in token_span_bs2token_span.items())
-    
-    # Remove accents
-    token_span_processed2token_span = dict((remove_accents(k), v) for k,v in token_span_punc2token_span.items())
-    
-    return token_span_processed2token_span
+# Columns of the supported TSV formats, by number of columns
+TSV_COLUMNS = {9: ['annotator', 'bunch', 'filename', 'mark', 'label', 
+                   'offset1', 'offset2', 'span', 'code'],
+               3: ['code', 'label', 'span'],
+               2: ['code', 'span']}
+
+# Label of the annotations of 2-column TSVs
+DEFAULT_LABEL = 'DeCS'
+
+# Separator of the source dictionary and the label of an annotation, when
+# several dictionaries are matched at once (see load_tsv_indexes)
+SOURCE_SEP = '::'
+
+# Stop words removed from annotations and texts (see set_stop_words)
+STOP_WORDS = SPANISH_STOP_WORDS
+STOP_WORD_SOURCES = ('bundled', 'spacy')
+
+
+def normalize_stop_words(stop_words):
+    '''
+    DESCRIPTION: stop words lowercased and without accents, as anchor tokens
+    are normalized (see index_tokens).
+    '''
+    return frozenset(remove_accents(word.lower()) for word in stop_words)
+
+
+NORMALIZED_STOP_WORDS = normalize_stop_words(STOP_WORDS)
+
+
+def set_stop_words(stop_words):
+    '''
+    DESCRIPTION: select the stop words removed from annotations and texts.
+    They are part of the dictionary fingerprint (see dictionary_fingerprint).
+
+    Parameters
+    ----------
+    stop_words : str or iterable
+        'bundled' (utils.stop_words, default), 'spacy' (spacy.lang.es,
+        imports spaCy) or iterable of stop words.
+    '''
+    global STOP_WORDS, NORMALIZED_STOP_WORDS
+    if stop_words == 'bundled':
+        STOP_WORDS = SPANISH_STOP_WORDS
+    elif stop_words == 'spacy':
+        from spacy.lang.es import STOP_WORDS as spacy_stop_words
+        STOP_WORDS = frozenset(spacy_stop_words)
+    elif isinstance(stop_words, str):
+        raise ValueError('Unknown stop words: {}'.format(stop_words))
+    else:
+        STOP_WORDS = frozenset(stop_words)
+    NORMALIZED_STOP_WORDS = normalize_stop_words(STOP_WORDS)
+
+
+def get_stop_words():
+    '''
+    DESCRIPTION: return the stop words selected with set_stop_words.
+    '''
+    return STOP_WORDS
 
 
 def parse_tsv(input_path):
@@ -110,24 +162,190 @@ def parse_tsv(input_path):
         path to TSV file with columns: ['annotator', 'bunch', 'filename', 
         'mark','label', 'offset1', 'offset2', 'span', 'code']
         Additionally, we can also have the path to a 3 column TSV: ['code', 'label', 'span']
+        or to a 2 column TSV: ['code', 'span'] (label DEFAULT_LABEL).
     
     Returns
     -------
     df_annot: pandas DataFrame
         It has 4 columns: 'filename', 'label', 'code', 'span'.
     '''
+    # pandas takes longer to import than the streaming loader (see 
+    # load_tsv_index) takes to read the whole TSV
+    import pandas as pd
     df_annot = pd.read_csv(input_path, sep='\t', header=0)
-    if len(df_annot.columns) == 8:
-        df_annot.columns=['annotator', 'bunch', 'filename', 'mark',
-                      'label', 'offset1', 'offset2', 'span', 'code']
+    if len(df_annot.columns) == 9:
+        df_annot.columns = TSV_COLUMNS[9]
+    elif len(df_annot.columns) == 3:
+        df_annot.columns = TSV_COLUMNS[3]
+        df_annot['filename'] = 'xx'
     else:
         df_annot.columns = ['code', 'span']
         #df_annot['label'] = 'MORFOLOGIA_NEOPLASIA'
         df_annot['filename']  ='xx'
-        df_annot['label'] = 'DeCS'
+        df_annot['label'] = DEFAULT_LABEL
     return df_annot
 
-def format_input_info(df_annot, min_upper):
+
+def read_tsv(input_path):
+    '''
+    DESCRIPTION: stream a TSV with codes (same formats as parse_tsv) without
+    pandas. Every field is read as a string; codes and labels are interned.
+    Codes are converted to integers if all of them are integers (as pandas 
+    infers them).
+    
+    Parameters
+    ----------
+    input_path: string
+        path to TSV file. The first line is the header.
+    
+    Returns
+    -------
+    annot2label: python dict
+        It has every annotation, in TSV order, and its label (the last one 
+        if it appears several times).
+    annot2code: python dict
+        It has every annotation and the list of its codes, in TSV order.
+    '''
+    annot2label = {}
+    annot2code = {}
+    code2value = {}
+    with open(input_path, encoding='utf-8', newline='') as f:
+        rows = csv.reader(f, delimiter='\t')
+        n_columns = len(next(rows))
+        if n_columns not in TSV_COLUMNS:
+            raise ValueError('{}: expected {} columns'.format(
+                input_path, ', '.join(map(str, sorted(TSV_COLUMNS)))))
+        columns = TSV_COLUMNS[n_columns]
+        i_code = columns.index('code')
+        i_span = columns.index('span')
+        i_label = columns.index('label') if 'label' in columns else None
+        for row in rows:
+            if not row:
+                continue
+            if len(row) != n_columns:
+                raise ValueError('{}:{}: expected {} columns'.format(
+                    input_path, rows.line_num, n_columns))
+            span = row[i_span]
+            code = code2value.setdefault(row[i_code], sys.intern(row[i_code]))
+            annot2label[span] = (DEFAULT_LABEL if i_label is None 
+                                 else sys.intern(row[i_label]))
+            if span in annot2code:
+                annot2code[span].append(code)
+            else:
+                annot2code[span] = [code]
+    
+    try:
+        code2value = dict((code, int(code)) for code in code2value)
+    except ValueError:
+        return annot2label, annot2code
+    # Integer codes: replace them in place
+    for codes in annot2code.values():
+        codes[:] = map(code2value.__getitem__, codes)
+    return annot2label, annot2code
+
+
+def load_tsv_index(input_path, min_upper, index_stats=None, prune=False):
+    '''
+    DESCRIPTION: build the inverted index and the annotation information of
+    a TSV with codes in one pass over its annotations, without pandas nor
+    intermediate copies of the annotations. Same output as parse_tsv and
+    format_input_info.
+    
+    Parameters
+    ----------
+    input_path: string
+        path to TSV file (see read_tsv).
+    min_upper: int.
+    index_stats: python dict
+        if given, it is filled with statistics of the inverted index (see 
+        build_annot_index).
+    prune: bool
+        see build_annot_index.
+    
+    Returns
+    -------
+    token2annot_ids: python dict
+    id2annot_info: list
+    '''
+    annot2label, annot2code = read_tsv(input_path)
+    annot2annot_processed = dict((annot, annot_tokens(annot, min_upper)) 
+                                 for annot in annot2label)
+    return build_annot_index(annot2annot_processed, annot2label, annot2code,
+                             min_upper, index_stats, prune)
+
+
+def source_label(source, label):
+    '''
+    DESCRIPTION: label of an annotation of the source dictionary source (see
+    load_tsv_indexes).
+    '''
+    return sys.intern(source + SOURCE_SEP + label)
+
+
+def label_source(label):
+    '''
+    DESCRIPTION: source dictionary of a label (see source_label). None if
+    the label has no source.
+    '''
+    source, sep, _ = label.partition(SOURCE_SEP)
+    return source if sep else None
+
+
+def load_tsv_indexes(dictionaries, min_upper, index_stats=None, prune=False):
+    '''
+    DESCRIPTION: build one inverted index and annotation information for
+    several TSVs with codes, so that texts are normalized and matched once
+    for all of them. Every TSV is indexed on its own (see load_tsv_index)
+    and the labels of its annotations are put in its namespace (see
+    source_label): find_annotations stores the predictions of every source
+    apart, so they are the same as with every dictionary alone.
+
+    Parameters
+    ----------
+    dictionaries: list
+        tuples (name, path to TSV file). Names must be unique and must not
+        contain SOURCE_SEP.
+    min_upper: int.
+    index_stats: python dict
+        if given, it is filled with the statistics of the inverted index of
+        every dictionary, by name (see build_annot_index).
+    prune: bool
+        see build_annot_index.
+
+    Returns
+    -------
+    token2annot_ids: python dict
+        IDs of the annotations of every dictionary, in dictionary order.
+    id2annot_info: list
+        annotations of every dictionary, in dictionary order.
+    '''
+    names = [name for name, _ in dictionaries]
+    if len(set(names)) != len(names):
+        raise ValueError('Dictionary names must be unique: {}'.format(
+            ', '.join(names)))
+    token2annot_ids = {}
+    id2annot_info = []
+    for name, input_path in dictionaries:
+        if (not name) or (SOURCE_SEP in name):
+            raise ValueError('Invalid dictionary name: {!r}'.format(name))
+        stats = None if index_stats is None else index_stats.setdefault(name, {})
+        source_token2annot_ids, source_id2annot_info = \
+            load_tsv_index(input_path, min_upper, stats, prune)
+        offset = len(id2annot_info)
+        for annot, label, codes, n_chars, n_words, annot_processed in \
+            source_id2annot_info:
+            id2annot_info.append((annot, source_label(name, label), codes,
+                                  n_chars, n_words, annot_processed))
+        for token, annot_ids in source_token2annot_ids.items():
+            annot_ids = [annot_id + offset for annot_id in annot_ids]
+            if token in token2annot_ids:
+                token2annot_ids[token].extend(annot_ids)
+            else:
+                token2annot_ids[token] = annot_ids
+    return token2annot_ids, id2annot_info
+
+
+def format_input_info(df_annot, min_upper, index_stats=None, prune=False):
     '''
     DESCRIPTION: Build useful Python dicts from DataFrame with info from TSV file
     
@@ -138,6 +356,12 @@ def format_input_info(df_annot, min_upper):
     min_upper: int. 
         It specifies the minimum number of characters of a word to lowercase 
         it (to prevent mistakes with acronyms).
+    index_stats: python dict
+        if given, it is filled with statistics of the inverted index (see 
+        build_annot_index).
+    prune: bool
+        index multi-word annotations only under their rarest token (see 
+        build_annot_index).
     
     Returns
     -------
@@ -145,16 +369,26 @@ def format_input_info(df_annot, min_upper):
     file2annot_processed: python dict
     annot2label: python dict
         It has every unmodified annotation and its label.
-    annot2annot_processed: python dict 
+    annot2annot_processed: python dict
         It has every unmodified annotation and the words it has normalized.
+    annot2code: python dict
+        It has every unmodified annotation and the list of its codes.
+    token2annot_ids: python dict
+        Inverted index. It relates every normalized token with the IDs of
+        the annotations that contain it.
+    id2annot_info: list
+        Annotation information indexed by annotation ID. Every element is a
+        tuple (annotation, label, codes, n_chars, n_words,
+        annotation normalized with normalize_str).
     '''
     # Build useful Python dicts from DataFrame with info from .ann files
     file2annot = {}
     file2annot['xx'] = df_annot.span.tolist()
     '''for filename in list(df_annot.filename):
         file2annot[filename] = list(df_annot[df_annot['filename'] == filename].span)'''
-        
-    set_annotations = set(df_annot.span)
+
+    # Keep TSV order so that annotation IDs are stable between runs
+    set_annotations = list(dict.fromkeys(df_annot.span))
     
     annot2label = dict(zip(df_annot.span,df_annot.label))
     
@@ -194,7 +428,213 @@ def format_input_info(df_annot, min_upper):
         aux = list(map(lambda x:annot2annot_processed[x], v))
         file2annot_processed[k] = aux
 
-    return file2annot, file2annot_processed, annot2label, annot2annot_processed, annot2code
+    # Inverted index: normalized token -> annotation IDs
+    token2annot_ids, id2annot_info = build_annot_index(annot2annot_processed,
+                                                       annot2label, annot2code,
+                                                       min_upper, index_stats,
+                                                       prune)
+
+    return (file2annot, file2annot_processed, annot2label, annot2annot_processed,
+            annot2code, token2annot_ids, id2annot_info)
+
+
+def build_annot_index(annot2annot_processed, annot2label, annot2code, min_upper,
+                      index_stats=None, prune=False):
+    '''
+    DESCRIPTION: build an inverted index from normalized tokens to the
+    annotations that contain them, and precompute the information of every
+    annotation needed while scanning a text.
+    
+    By default every annotation is indexed under all its tokens. With prune,
+    multi-word annotations are only indexed under their rarest anchor token
+    (the one contained in fewest annotations): they can only be found in a
+    text where that token is. Anchor tokens are alphabetic and longer than 
+    min_upper characters, so they are normalized the same way in the 
+    annotation and in the text (see format_text_info), and they are not 
+    stop words once normalized (format_text_info drops the words of the text
+    whose lowercase form is a stop word). Annotations without anchor tokens
+    are indexed under all their tokens.
+    Pruning is not lossless: predictions are stored once per visit of an
+    annotation (see find_annotations), so with fewer visits an annotation 
+    whose prediction is later removed by a containing one may not be 
+    predicted elsewhere, and some codes are lost. It only makes sense with
+    the window engine: the trie and hash engines already locate every 
+    multi-word annotation, so never prune their index.
+
+    Parameters
+    ----------
+    annot2annot_processed: python dict
+        It has every unmodified annotation and the words it has normalized.
+    annot2label: python dict
+        It has every unmodified annotation and its label.
+    annot2code: python dict
+        It has every unmodified annotation and the list of its codes.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+    index_stats: python dict
+        if given, it is filled with statistics of the pruning of the index
+        (see prune_stats).
+    prune: bool
+        index multi-word annotations only under their anchor token (window
+        engine only, it may lose codes). If False (default), every 
+        annotation is indexed under all its tokens.
+
+    Returns
+    -------
+    token2annot_ids: python dict
+        It relates every normalized token with the list of IDs of the
+        annotations that contain it.
+    id2annot_info: list
+        Every element is a tuple (annotation, label, codes, n_chars, n_words,
+        annotation normalized with normalize_str).
+    '''
+    # Dictionary frequency: number of annotations that contain every token.
+    # An annotation may contain the same token twice
+    token2freq = {}
+    for tokens in annot2annot_processed.values():
+        for token in dict.fromkeys(tokens):
+            token2freq[token] = token2freq.get(token, 0) + 1
+
+    token2annot_ids = {}
+    id2annot_info = []
+    n_anchored = 0
+    for annot_id, (annot, tokens) in enumerate(annot2annot_processed.items()):
+        n_words = len(annot.split())
+        id2annot_info.append((annot, annot2label[annot], annot2code[annot],
+                              len(annot), n_words,
+                              normalize_str(annot, min_upper)))
+        tokens = index_tokens(tokens, n_words, token2freq, min_upper, prune)
+        if prune & (n_words > 1) & (len(tokens) == 1):
+            n_anchored = n_anchored + 1
+        for token in tokens:
+            if token in token2annot_ids:
+                token2annot_ids[token].append(annot_id)
+            else:
+                token2annot_ids[token] = [annot_id]
+
+    if index_stats is not None:
+        index_stats.update(prune_stats(token2freq, token2annot_ids))
+        index_stats['anchored_annotations'] = n_anchored
+        
+    return token2annot_ids, id2annot_info
+
+
+def index_tokens(tokens, n_words, token2freq, min_upper, prune=False):
+    '''
+    DESCRIPTION: tokens an annotation is indexed under in the inverted index
+    (see build_annot_index).
+
+    Parameters
+    ----------
+    tokens: list
+        normalized tokens of the annotation (see annot_tokens).
+    n_words: int
+        number of words of the annotation.
+    token2freq: python dict
+        number of annotations that contain every token.
+    min_upper: int.
+    prune: bool
+
+    Returns
+    -------
+    tokens: list
+        unique tokens: only the rarest anchor token if the annotation is 
+        pruned.
+    '''
+    tokens = list(dict.fromkeys(tokens))
+    if prune & (n_words > 1):
+        # Words of the text whose lowercase form is a stop word are dropped
+        # (see format_text_info): they cannot be anchors
+        anchors = [token for token in tokens 
+                   if (len(token) > min_upper) and token.isalpha() and
+                   (token not in NORMALIZED_STOP_WORDS)]
+        if anchors:
+            return [min(anchors, key=lambda x: token2freq[x])]
+    return tokens
+
+
+def annot_tokens(annot, min_upper):
+    '''
+    DESCRIPTION: normalized tokens of one annotation, as in 
+    annot2annot_processed of format_input_info: split by spaces, remove 
+    stopwords and single-character words, trim punctuation, lowercase words
+    longer than min_upper and remove accents.
+    '''
+    tokens = annot.split(' ')
+    tokens = filter(lambda x: x not in STOP_WORDS, tokens)
+    tokens = filter(lambda x: len(x) > 1, tokens)
+    tokens = map(lambda x: x.strip(string.punctuation + ' '), tokens)
+    tokens = map(lambda x: x.lower() if len(x) > min_upper else x, tokens)
+    return list(map(remove_accents, tokens))
+
+
+def token_frequencies(id2annot_info, min_upper):
+    '''
+    DESCRIPTION: dictionary frequency of every token: number of annotations
+    that contain it. Removed annotations (None) are skipped.
+    '''
+    token2freq = {}
+    for info in id2annot_info:
+        if info is None:
+            continue
+        for token in dict.fromkeys(annot_tokens(info[0], min_upper)):
+            token2freq[token] = token2freq.get(token, 0) + 1
+    return token2freq
+
+
+def prune_stats(token2freq, token2annot_ids, n_top=10):
+    '''
+    DESCRIPTION: statistics of the pruning of the inverted index.
+
+    Parameters
+    ----------
+    token2freq: python dict
+        dictionary frequency of every token (number of annotations that 
+        contain it): number of postings of the token without pruning.
+    token2annot_ids: python dict
+        pruned inverted index.
+    n_top: int
+        number of most frequent tokens reported.
+
+    Returns
+    -------
+    stats: python dict
+        number of postings with and without pruning, pruning ratio (fraction
+        of postings removed) and the most frequent tokens with their number
+        of postings with and without pruning.
+    '''
+    postings_full = sum(token2freq.values())
+    postings = sum(map(len, token2annot_ids.values()))
+    top_tokens = sorted(token2freq, key=lambda x: -token2freq[x])[:n_top]
+    return {'tokens': len(token2freq),
+            'postings_full': postings_full,
+            'postings': postings,
+            'pruning_ratio': 1 - postings / postings_full if postings_full else 0.0,
+            'top_tokens': [(token, token2freq[token], 
+                            len(token2annot_ids.get(token, [])))
+                           for token in top_tokens]}
+
+
+def index_stats_report(index_stats):
+    '''
+    DESCRIPTION: text summary of the statistics of the inverted index (see 
+    build_annot_index). The pruning is only reported if the index was 
+    pruned.
+    '''
+    if index_stats['anchored_annotations'] == 0:
+        return 'Inverted index: {} tokens, {} postings'.format(
+            index_stats['tokens'], index_stats['postings'])
+    lines = ['Inverted index: {} tokens, {} postings ({} without pruning, '
+             '{:.1%} pruned), {} multi-word annotations indexed by their '
+             'rarest token'.format(index_stats['tokens'], index_stats['postings'],
+                                   index_stats['postings_full'],
+                                   index_stats['pruning_ratio'],
+                                   index_stats['anchored_annotations']),
+             'Most frequent tokens (annotations / postings after pruning):']
+    for token, freq, postings in index_stats['top_tokens']:
+        lines.append('  {:20} {:7d} {:7d}'.format(token, freq, postings))
+    return '\n'.join(lines)
 
 
 def format_text_info(txt, min_upper):
@@ -204,6 +644,8 @@ def format_text_info(txt, min_upper):
     2. Obtain dictionary with words of interest and their position in the 
     original text. Words of interest are normalized: lowercased and removed 
     accents.
+    Both are built in one pass over the tokens of the text: positions are 
+    the exact offsets of the tokens (the text is not searched again).
     
     Parameters
     ----------
@@ -217,97 +659,77 @@ def format_text_info(txt, min_upper):
     -------
     words_processed2pos: dictionary
         It relates the word normalzied (trimmed, removed stpw, lowercased, 
-        removed accents) and its position in the original text.
+        removed accents) and its positions in the original text, in text 
+        order.
     words_final: set
             set of words in text.
     '''
-    
-    # Get individual words and their position in original txt
-    words = tokenize(txt)
-    #print(words)
-    
-    # Remove beginning and end punctuation and whitespaces. 
-    words_no_punctuation = list(map(lambda x: x.strip(string.punctuation + ' '), words))
-    #print(words_no_punctuation)
-    
-    # Remove stopwords and single-character words
-    large_words = list(filter(lambda x: len(x) > 1, words_no_punctuation))
-    #print(large_words)
-    words_no_stw = set(filter(lambda x: x.lower() not in STOP_WORDS, large_words))
-    #print(words_no_stw)
-    # Create dict with words and their positions in text
-    words2pos = {}
-    for word in words_no_stw:
-        occurrences = list(re.finditer(re.escape(word), txt))
-        if len(occurrences) == 0:
-            print('ERROR: ORIGINAL WORD NOT FOUND IN ORIGINAL TEXT')
-            print(word)
-        pos = list(map(lambda x: x.span(), occurrences))
-        words2pos[word] = pos
-        
-    #print(words2pos)
-    
-    # Dictionary relating original words with words processed
-    words2words = dict(zip(words_no_stw, words_no_stw))
-    words2words_processed = dict((k, remove_accents(k.lower())) if len(k) > min_upper else 
-                                (k,v) for k,v in words2words.items())
-    # Map original position to processed word
     words_processed2pos = {}
-    for k, v in words2pos.items():
-        k_processed = words2words_processed[k]
-        if k_processed not in words_processed2pos:
-            words_processed2pos[k_processed] = v
+    for token, start in token_offsets(txt, tokenize(txt)):
+        # Remove beginning and end punctuation and whitespaces
+        word = token.lstrip(string.punctuation + ' ')
+        start = start + len(token) - len(word)
+        word = word.rstrip(string.punctuation + ' ')
+        
+        # Remove stopwords and single-character words
+        if (len(word) <= 1) or (word.lower() in STOP_WORDS):
+            continue
+        
+        # Map original position to processed word
+        word_processed = normalize_word(word, min_upper)
+        if word_processed in words_processed2pos:
+            words_processed2pos[word_processed].append((start, start + len(word)))
         else:
-            words_processed2pos[k_processed] = words_processed2pos[k_processed] + v
-    
-    '''# lowercase words and remove accents from words -> HERE I LOSE INFORMATION!
-    # If I have 'Sarcoma' and 'sarcoma', only one of the two of them is kept
-    words_processed2pos = dict((remove_accents(k.lower()), v) if len(k) > min_upper else 
-                                (k,v) for k,v in words2pos.items())'''
+            words_processed2pos[word_processed] = [(start, start + len(word))]
     
     # Set of transformed words
     words_final = set(words_processed2pos)
     
     return words_final, words_processed2pos
 
-def store_prediction(pos_matrix, predictions, off0, off1, original_label, 
-                     original_annot, txt, codes):
+def store_prediction(predictions, off0, off1, original_label, original_annot, 
+                     txt, codes):
+    '''
+    DESCRIPTION: store a new prediction (one per code) in the SpanSet 
+    predictions, after removing the old predictions it contains.
+    '''
                                         
     # 1. Eliminate old annotations if the new one contains them
-    (pos_matrix, 
-     predictions) = eliminate_contained_annots(pos_matrix, predictions, off0, off1)
+    predictions = eliminate_contained_annots(predictions, off0, off1)
     
     # 2. STORE NEW PREDICTION
-    for code in codes:
-        predictions.append([txt[off0:off1], off0, off1, original_label, code])   
-        pos_matrix.append([off0, off1])
+    # Span texts are sliced from txt when predictions are read (see Predictions)
+    if codes:
+        predictions.add(off0, off1, original_label, codes)
         
-    return predictions, pos_matrix
+    return predictions
 
 
-def eliminate_contained_annots(pos_matrix, new_annotations, off0, off1):
+def eliminate_contained_annots(predictions, off0, off1):
     '''
     DESCRIPTION: function to be used when a new annotation is found. 
               It check whether this new annotation contains in it an already 
               discovered annotation. In that case, the old annotation is 
               redundant, since the new one contains it. Then, the function
               removes the old annotation.
+              predictions is a SpanSet: contained annotations are found with
+              a binary search.
     '''
-    to_eliminate = [pos for item, pos in zip(pos_matrix, range(0, len(new_annotations))) 
-                    if (off0<=item[0]) & (item[1]<=off1)]
-    new_annotations = [item for item, pos in zip(new_annotations, range(0, len(new_annotations)))
-                       if pos not in to_eliminate]
-    pos_matrix = [item for item in pos_matrix if not (off0<=item[0]) & (item[1]<=off1)]
+    predictions.remove_contained(off0, off1)
     
-    return pos_matrix, new_annotations
+    return predictions
 
 
 def check_surroundings(txt, span, original_annot, n_chars, n_words, original_label,
-                       predictions, pos_matrix, min_upper, code):
+                       predictions, min_upper, code,
+                       original_annotation_processed=None):
     '''
     DESCRIPTION: explore the surroundings of the match.
               Do not care about extra whitespaces or punctuation signs in 
               the middle of the annotation.
+              predictions is the SpanSet of stored predictions.
+              original_annotation_processed is the annotation already
+              normalized with normalize_str. If not given, it is computed.
     '''
     
     ## 1. Get normalized surroundings ##
@@ -328,7 +750,8 @@ def check_surroundings(txt, span, original_annot, n_chars, n_words, original_lab
     token_span2id, id2token_span_pos, token_spans = tokenize_span(large_span_reg,
                                                                   n_words)
     # Normalize
-    original_annotation_processed = normalize_str(original_annot, min_upper)
+    if original_annotation_processed is None:
+        original_annotation_processed = normalize_str(original_annot, min_upper)
     token_span_processed2token_span = normalize_tokens(token_spans, min_upper)
     
     ## 2. Match ##
@@ -340,12 +763,11 @@ def check_surroundings(txt, span, original_annot, n_chars, n_words, original_lab
         off1 = (pos[1] + first_space + max(0, span[0]-n_chars))
         
         # Check new annotation is not contained in a previously stored new annotation
-        if not any([(item[0]<=off0) & (off1<= item[1]) for item in pos_matrix]):
+        if not predictions.contains(off0, off1):
             # STORE PREDICTION and eliminate old predictions contained in the new one.
-            predictions, pos_matrix = store_prediction(pos_matrix, predictions,
-                                                       off0, off1, original_label,
-                                                       original_annot, txt, code)
+            predictions = store_prediction(predictions, off0, off1, original_label,
+                                           original_annot, txt, code)
     except: 
         pass
     
-    return predictions, pos_matrix
\ No newline at end of file
+    return predictions
\ No newline at end of file
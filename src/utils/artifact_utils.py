@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 09:31:05 2026
+
+Precompiled dictionary artifact
+"""
+
+import gc
+import os
+import pickle
+import hashlib
+from utils.app_specific_utils import (get_stop_words, load_tsv_index, 
+                                      token_frequencies)
+from utils.matching_utils import build_term_trie, build_ngram_index
+
+# Increase it every time the content of the artifact changes
+ARTIFACT_VERSION = 6
+ARTIFACT_MAGIC = b'MESINESP-DICT'
+
+
+def dictionary_fingerprint(tsv_path, min_upper):
+    '''
+    DESCRIPTION: obtain a fingerprint of the processed dictionary. It
+    changes when the content of the TSV, min_upper, the stop words or the 
+    artifact version change.
+
+    Parameters
+    ----------
+    tsv_path: str
+        path to input TSV with codes.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+
+    Returns
+    -------
+    fingerprint: str
+        hexadecimal SHA-256 digest.
+    '''
+    h = hashlib.sha256()
+    h.update('{}|{}|'.format(ARTIFACT_VERSION, min_upper).encode('utf-8'))
+    h.update(' '.join(sorted(get_stop_words())).encode('utf-8') + b'|')
+    with open(tsv_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compile_dictionary(tsv_path, min_upper, artifact_path, engine='trie',
+                       index_stats=None):
+    '''
+    DESCRIPTION: parse the TSV, build the processed dictionary (inverted
+    index, annotation information, term trie and n-gram index) and write it 
+    to a binary artifact.
+
+    The artifact is a header line (magic, version and fingerprint) followed
+    by a pickle payload (see write_artifact).
+
+    Parameters
+    ----------
+    tsv_path: str
+        path to input TSV with codes.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+    artifact_path: str
+        path to the artifact to write.
+    engine: str
+        matching engine whose structure is returned ('window', 'trie' or 
+        'hash').
+    index_stats: python dict
+        if given, it is filled with statistics of the inverted index (see 
+        build_annot_index).
+
+    Returns
+    -------
+    token2annot_ids: python dict
+    id2annot_info: list
+    term_index: python dict (trie), NgramIndex (hash) or None (window)
+    '''
+    check_artifact_path(artifact_path)
+    fingerprint = dictionary_fingerprint(tsv_path, min_upper)
+
+    token2annot_ids, id2annot_info = load_tsv_index(tsv_path, min_upper, 
+                                                    index_stats)
+    term_trie = build_term_trie(id2annot_info)
+    ngram_index = build_ngram_index(id2annot_info)
+
+    # token2freq and annot2id are only needed by incremental updates (see
+    # update_utils.py)
+    payload = {'min_upper': min_upper,
+               'tsv_path': os.path.abspath(tsv_path),
+               'token2annot_ids': token2annot_ids,
+               'id2annot_info': id2annot_info,
+               'term_trie': term_trie,
+               'ngram_index': ngram_index,
+               'token2freq': token_frequencies(id2annot_info, min_upper),
+               'annot2id': dict((info[0], annot_id) for annot_id, info 
+                                in enumerate(id2annot_info))}
+    write_artifact(payload, fingerprint, artifact_path)
+
+    return token2annot_ids, id2annot_info, select_term_index(payload, engine)
+
+
+def write_artifact(payload, fingerprint, artifact_path):
+    '''
+    DESCRIPTION: write a header line (magic, version and fingerprint) and
+    the pickled payload.
+    '''
+    header = b' '.join([ARTIFACT_MAGIC, str(ARTIFACT_VERSION).encode('ascii'),
+                        fingerprint.encode('ascii')]) + b'\n'
+
+    # Write to a temporary file first: an interrupted compilation must not
+    # leave a truncated artifact behind
+    tmp_path = artifact_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, artifact_path)
+
+
+def read_artifact(artifact_path):
+    '''
+    DESCRIPTION: read the payload of an artifact (its header is skipped).
+    '''
+    # The payload has hundreds of thousands of small containers: the 
+    # garbage collector would otherwise run many times while unpickling them
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(artifact_path, 'rb') as f:
+            f.readline(256)
+            return pickle.load(f)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def is_current_artifact(tsv_path, min_upper, artifact_path):
+    '''
+    DESCRIPTION: check whether an artifact exists and was built from the
+    current TSV content, min_upper and artifact version.
+    '''
+    if not os.path.exists(artifact_path):
+        return False
+    version, fingerprint = read_artifact_header(artifact_path)
+    return ((version == ARTIFACT_VERSION) &
+            (fingerprint == dictionary_fingerprint(tsv_path, min_upper)))
+
+
+def select_term_index(payload, engine):
+    '''
+    DESCRIPTION: structure of the artifact payload used by a matching engine.
+    '''
+    if engine == 'trie':
+        return payload['term_trie']
+    if engine == 'hash':
+        return payload['ngram_index']
+    if engine == 'window':
+        return None
+    raise ValueError('Unknown engine: {}'.format(engine))
+
+
+def read_artifact_header(artifact_path):
+    '''
+    DESCRIPTION: read the header of an artifact.
+
+    Returns
+    -------
+    version: int
+        artifact version. None if the file is not an artifact.
+    fingerprint: str
+        fingerprint of the dictionary. None if the file is not an artifact.
+    '''
+    with open(artifact_path, 'rb') as f:
+        header = f.readline(256).split()
+    if (len(header) != 3) or (header[0] != ARTIFACT_MAGIC) or \
+       (not header[1].isdigit()):
+        return None, None
+    return int(header[1]), header[2].decode('ascii', 'replace')
+
+
+def check_artifact_path(artifact_path):
+    '''
+    DESCRIPTION: check that an artifact can be written to artifact_path: it
+    does not exist, it is empty or it is an artifact (of any version or
+    fingerprint). Raises ValueError otherwise, so that a TSV or a JSON file
+    given by mistake is not overwritten.
+    '''
+    if (not os.path.exists(artifact_path)) or (os.path.getsize(artifact_path) == 0):
+        return
+    version, _ = read_artifact_header(artifact_path)
+    if version is None:
+        raise ValueError('{} exists and is not a compiled dictionary'.format(
+            artifact_path))
+
+
+def load_dictionary(tsv_path, min_upper, artifact_path, engine='trie'):
+    '''
+    DESCRIPTION: load the processed dictionary from a compiled artifact. If
+    the artifact does not exist or it was built from another TSV content,
+    another min_upper or another artifact version, compile it again. If
+    artifact_path is another kind of file, ValueError is raised (see
+    check_artifact_path).
+
+    Parameters
+    ----------
+    tsv_path: str
+        path to input TSV with codes.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+    artifact_path: str
+        path to the compiled artifact.
+    engine: str
+        matching engine whose structure is returned ('window', 'trie' or 
+        'hash').
+
+    Returns
+    -------
+    token2annot_ids: python dict
+    id2annot_info: list
+    term_index: python dict (trie), NgramIndex (hash) or None (window)
+    '''
+    check_artifact_path(artifact_path)
+    if is_current_artifact(tsv_path, min_upper, artifact_path):
+        payload = read_artifact(artifact_path)
+        return (payload['token2annot_ids'], payload['id2annot_info'],
+                select_term_index(payload, engine))
+    if os.path.exists(artifact_path):
+        print('Compiled dictionary {} is outdated. Rebuilding it...'.format(artifact_path))
+
+    return compile_dictionary(tsv_path, min_upper, artifact_path, engine)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:36:09 2026
+
+On-disk cache of the predictions of already scanned texts
+"""
+
+import hashlib
+import json
+import sqlite3
+from utils.artifact_utils import dictionary_fingerprint
+from utils.span_utils import Predictions
+
+# Commit the cache every COMMIT_EVERY insertions
+COMMIT_EVERY = 100
+
+# Version of the format of the cached predictions. Entries of other versions
+# are never returned (see cache_fingerprint)
+CACHE_VERSION = 2
+
+
+def cache_fingerprint(tsv_path, min_upper, engine, tokenizer):
+    '''
+    DESCRIPTION: fingerprint of everything that changes the predictions of a
+    text: dictionary content, min_upper, engine and tokenizer. tsv_path is
+    the path to the TSV or a list of tuples (name, path) of several
+    dictionaries (see load_tsv_indexes).
+
+    Returns
+    -------
+    fingerprint: str
+    '''
+    if isinstance(tsv_path, str):
+        dictionary = dictionary_fingerprint(tsv_path, min_upper)
+    else:
+        dictionary = ','.join('{}={}'.format(name, dictionary_fingerprint(path, min_upper))
+                              for name, path in tsv_path)
+    return '{}|{}|{}|{}'.format(dictionary, engine, tokenizer, CACHE_VERSION)
+
+
+class ResultCache():
+    '''
+    DESCRIPTION: SQLite cache relating texts with their predictions.
+
+    Keys are SHA-256 digests of the configuration fingerprint and the text,
+    so entries of other dictionaries or configurations are never returned.
+    Texts are hashed as they are: predictions store character offsets,
+    which would not be valid for a differently normalized text. Span texts
+    are not stored: they are sliced from the text (see Predictions.to_rows).
+    The cache keeps at most max_entries texts: the least recently used ones
+    are evicted.
+
+    Usage:
+        with ResultCache(path, fingerprint) as cache:
+            predictions = cache.get(txt)
+            if predictions is None:
+                predictions = ...
+                cache.put(txt, predictions)
+    '''
+
+    def __init__(self, path, fingerprint, max_entries=100000):
+        self.path = path
+        self.fingerprint = fingerprint.encode('utf-8')
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.n_pending = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                          '(key BLOB PRIMARY KEY, predictions TEXT NOT NULL, '
+                          'last_used INTEGER NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used '
+                          'ON entries (last_used)')
+        self.n_entries, clock = self.conn.execute(
+            'SELECT COUNT(*), MAX(last_used) FROM entries').fetchone()
+        # Logical clock: last_used of the most recently used entry
+        self.clock = clock or 0
+
+    def key(self, txt):
+        h = hashlib.sha256(self.fingerprint)
+        h.update(b'\0')
+        h.update(txt.encode('utf-8'))
+        return h.digest()
+
+    def get(self, txt):
+        '''
+        DESCRIPTION: cached predictions of a text. None if it is not cached.
+        '''
+        key = self.key(txt)
+        row = self.conn.execute('SELECT predictions FROM entries WHERE key = ?',
+                                (key,)).fetchone()
+        if row is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.clock = self.clock + 1
+        self.conn.execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                          (self.clock, key))
+        self._pending()
+        return Predictions.from_rows(txt, json.loads(row[0]))
+
+    def put(self, txt, predictions):
+        '''
+        DESCRIPTION: store the predictions of a text and evict the least
+        recently used entries if the cache is full.
+        '''
+        self.clock = self.clock + 1
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO entries VALUES (?, ?, ?)',
+            (self.key(txt), json.dumps(predictions.to_rows(), ensure_ascii=False),
+             self.clock))
+        self.n_entries = self.n_entries + cursor.rowcount
+        if self.n_entries > self.max_entries:
+            n_evicted = self.n_entries - self.max_entries
+            self.conn.execute('DELETE FROM entries WHERE key IN (SELECT key '
+                              'FROM entries ORDER BY last_used LIMIT ?)',
+                              (n_evicted,))
+            self.n_entries = self.max_entries
+            self.evictions = self.evictions + n_evicted
+        self._pending()
+
+    def _pending(self):
+        self.n_pending = self.n_pending + 1
+        if self.n_pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self.n_pending = 0
+
+    def stats(self):
+        '''
+        DESCRIPTION: hits, misses, hit rate, evictions and entries.
+        '''
+        n_lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / n_lookups if n_lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': self.n_entries}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:21:50 2026
+
+Append-only journal of the articles already scanned, to resume interrupted
+runs
+"""
+
+import json
+import os
+from utils.span_utils import Predictions
+
+
+class Checkpoint():
+    '''
+    DESCRIPTION: journal with a header line {"fingerprint"} and one JSON line
+    [index, id, predictions] per scanned article, where index is the position
+    of the article in the input and predictions are lists
+    [off0, off1, label, code] (see Predictions.to_rows). Lines are buffered
+    and written to disk (flush and fsync) every `every` articles, so at most
+    `every` articles are scanned again after a crash.
+
+    When the journal exists, its records are loaded: articles with the same
+    position and ID are not scanned again (see iter_annots). A truncated
+    last line (the run was killed while writing it) is discarded. A journal
+    written with another fingerprint (dictionary or configuration, see
+    cache_fingerprint) is discarded whole: its predictions are not valid.
+
+    Usage:
+        with Checkpoint(path, fingerprint) as checkpoint:
+            predictions = checkpoint.get(index, _id, txt)
+            if predictions is None:
+                predictions = ...
+                checkpoint.record(index, _id, predictions)
+        checkpoint.remove()   # once the output is complete
+    '''
+
+    def __init__(self, path, fingerprint, every=100):
+        self.path = path
+        self.every = every
+        self.records = {}
+        self.n_pending = 0
+        self.n_resumed = 0
+        # True if an existing journal of another fingerprint was discarded
+        self.discarded = False
+        header = (json.dumps({'fingerprint': fingerprint}) + '\n').encode('utf-8')
+        valid_size = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                first_line = f.readline()
+                if first_line == header:
+                    valid_size = len(header)
+                else:
+                    self.discarded = first_line != b''
+                    # Skip the records
+                    f.seek(0, os.SEEK_END)
+                for line in f:
+                    try:
+                        index, _id, predictions = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    self.records[index] = (_id, predictions)
+                    valid_size = valid_size + len(line)
+        self.f = open(path, 'ab')
+        # Drop the truncated last line, if any
+        self.f.truncate(valid_size)
+        if valid_size == 0:
+            self.f.write(header)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, index, _id, txt):
+        '''
+        DESCRIPTION: journaled predictions of an article with text txt. None 
+        if it was not scanned in a previous run.
+        '''
+        record = self.records.get(index)
+        if (record is None) or (record[0] != _id):
+            return None
+        self.n_resumed = self.n_resumed + 1
+        return Predictions.from_rows(txt, record[1])
+
+    def record(self, index, _id, predictions):
+        '''
+        DESCRIPTION: add the predictions of an article to the journal.
+        '''
+        line = json.dumps([index, _id, predictions.to_rows()], ensure_ascii=False)
+        self.f.write(line.encode('utf-8') + b'\n')
+        self.n_pending = self.n_pending + 1
+        if self.n_pending >= self.every:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.n_pending = 0
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def remove(self):
+        '''
+        DESCRIPTION: close and delete the journal.
+        '''
+        self.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -11,11 +11,101 @@ import string
 import unicodedata
 import re
 import argparse
-from spacy.lang.es import Spanish
+import os
+from functools import lru_cache
+
+# Characters split from the beginning and end of a token by regex_tokenize
+TOKEN_EDGE_CHARS = string.punctuation + '¿¡«»“”‘’…–—'
+
+# Infixes split by regex_tokenize (as spaCy Spanish tokenizer does): commas 
+# between letters, slashes, colons and comparison signs between an 
+# alphanumeric character and a letter, periods between a lowercase and an
+# uppercase letter (a missing space after a sentence), arithmetic signs
+# between digits and ellipsis
+TOKEN_INFIX_RE = re.compile(r'((?<=[^\W\d_]),(?=[^\W\d_])|(?<=[^\W_])[/:<>=](?=[^\W\d_])|' +
+                            r'(?<=[^\W\d_A-ZÁÉÍÓÚÜÑ])\.(?=[A-ZÁÉÍÓÚÜÑ])|' +
+                            r'(?<=[0-9])[+*^](?=[0-9-])|\.\.+|…)')
+
+# Tokenizer used by tokenize (see set_tokenizer)
+_tokenizer = {'name': 'spacy', 'function': None}
+_spacy_nlp = None
+
+
+def get_spacy_nlp():
+    '''
+    DESCRIPTION: return the spaCy Spanish pipeline. It is built only once.
+    spaCy is imported here: it takes about a second, and runs with the regex
+    tokenizer do not need it.
+    '''
+    global _spacy_nlp
+    if _spacy_nlp is None:
+        from spacy.lang.es import Spanish
+        _spacy_nlp = Spanish()
+    return _spacy_nlp
+
+
+def spacy_tokenize(text):
+    '''
+    DESCRIPTION: tokenize a Spanish string with spaCy tokenizer.
+    '''
+    return [token.text for token in get_spacy_nlp().tokenizer(text)]
+
+
+def regex_tokenize(text):
+    '''
+    DESCRIPTION: tokenize a Spanish string with regular expressions only. 
+    Word boundaries are equivalent to spaCy ones: text is split by 
+    whitespaces, initial and final punctuation signs are split from words 
+    and so are the infixes of TOKEN_INFIX_RE.
+    '''
+    tokens = []
+    for chunk in text.split():
+        core = chunk.lstrip(TOKEN_EDGE_CHARS)
+        tokens.extend(chunk[:len(chunk) - len(core)])
+        word = core.rstrip(TOKEN_EDGE_CHARS)
+        if word:
+            tokens.extend(filter(None, TOKEN_INFIX_RE.split(word)))
+        tokens.extend(core[len(word):])
+    return tokens
+
+
+TOKENIZERS = {'spacy': spacy_tokenize, 'regex': regex_tokenize}
+
+
+def set_tokenizer(tokenizer):
+    '''
+    DESCRIPTION: select the tokenizer used by tokenize.
+
+    Parameters
+    ----------
+    tokenizer : str or function
+        name of a tokenizer in TOKENIZERS ('spacy', 'regex') or function that
+        receives a string and returns the list of its tokens.
+    '''
+    if callable(tokenizer):
+        _tokenizer['name'] = getattr(tokenizer, '__name__', 'custom')
+        _tokenizer['function'] = tokenizer
+    elif tokenizer in TOKENIZERS:
+        _tokenizer['name'] = tokenizer
+        _tokenizer['function'] = TOKENIZERS[tokenizer]
+    else:
+        raise ValueError('Unknown tokenizer: {}'.format(tokenizer))
+
+
+def get_tokenizer():
+    '''
+    DESCRIPTION: return the tokenizer used by tokenize (name or function, 
+    as given to set_tokenizer).
+    '''
+    if _tokenizer['name'] in TOKENIZERS:
+        return _tokenizer['name']
+    return _tokenizer['function']
+
 
 def tokenize(text):
     '''
-    Tokenize a string in Spanish
+    Tokenize a string in Spanish with the tokenizer selected with 
+    set_tokenizer (spaCy by default). The tokenizer is built only once.
     Parameters
     ----------
     text : str
@@ -25,12 +115,32 @@ def tokenize(text):
     tokenized : list
         List of tokens (includes punctuation tokens).
     '''
-    nlp = Spanish()
-    doc = nlp(text)
-    token_list = []
-    for token in doc:
-        token_list.append(token.text)
-    return token_list
+    if _tokenizer['function'] is None:
+        set_tokenizer(_tokenizer['name'])
+    return _tokenizer['function'](text)
+
+
+def tokenize_batch(texts, batch_size=64):
+    '''
+    DESCRIPTION: tokenize many Spanish strings. With spaCy, they are sent 
+    in batches through the tokenizer pipe.
+
+    Parameters
+    ----------
+    texts : iterable of str
+    batch_size : int
+
+    Yields
+    ------
+    tokenized : list
+        List of tokens of every text, in input order.
+    '''
+    if _tokenizer['name'] == 'spacy':
+        for doc in get_spacy_nlp().tokenizer.pipe(texts, batch_size=batch_size):
+            yield [token.text for token in doc]
+    else:
+        for text in texts:
+            yield tokenize(text)
 
 
 def Flatten(ul):
@@ -54,9 +164,138 @@ def Flatten(ul):
             fl += [i]
     return fl
 
-def remove_accents(data):
+def remove_accents_nfkd(data):
+    '''
+    DESCRIPTION: remove accents with NFKD decomposition, keeping only 
+    printable ASCII characters. Slow: used to fill the translation tables.
+    '''
     return ''.join(x for x in unicodedata.normalize('NFKD', data) if x in string.printable)
 
+
+class CharTable(dict):
+    '''
+    DESCRIPTION: translation table for str.translate. It maps every 
+    character code to function(character). Latin characters are computed
+    in advance and the rest the first time they are found.
+    '''
+    def __init__(self, function, precompute=range(0x250)):
+        self.function = function
+        for code in precompute:
+            self[code] = function(chr(code))
+
+    def __missing__(self, code):
+        value = self.function(chr(code))
+        self[code] = value
+        return value
+
+
+# Translation tables equivalent to remove_accents_nfkd and to 
+# remove_accents_nfkd of the lowercased string (NFKD decomposes every 
+# character independently and only ASCII characters are kept)
+ACCENT_TABLE = CharTable(remove_accents_nfkd)
+LOWER_ACCENT_TABLE = CharTable(lambda x: remove_accents_nfkd(x.lower()))
+
+# Translation table to remove punctuation
+PUNCT_TABLE = str.maketrans('', '', string.punctuation)
+
+# Maximum number of surface forms kept by every normalization cache
+NORMALIZATION_CACHE_SIZE = 1 << 18
+
+
+def remove_accents(data):
+    '''
+    DESCRIPTION: remove accents and non-printable characters (same output as
+    remove_accents_nfkd).
+    '''
+    return data.translate(ACCENT_TABLE)
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def normalize_word(word, min_upper):
+    '''
+    DESCRIPTION: normalize a word of the text: lowercase it and remove 
+    its accents, only if it is longer than min_upper characters (to 
+    prevent mistakes with acronyms).
+    Results are cached by surface word and shared by all the documents of
+    the process (see normalization_cache_stats).
+    '''
+    if len(word) > min_upper:
+        return word.translate(LOWER_ACCENT_TABLE)
+    return word
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def normalize_span(span, min_upper):
+    '''
+    DESCRIPTION: normalize a token combination of the text (see 
+    normalize_tokens): lowercase it if it is longer than min_upper 
+    characters, remove extra whitespaces, punctuation and accents.
+    Results are cached by surface form, as in normalize_word.
+    '''
+    if len(span) > min_upper:
+        span = span.lower()
+    span = re.sub(r'\s+', ' ', span).strip()
+    return span.translate(PUNCT_TABLE).translate(ACCENT_TABLE)
+
+
+# Cached normalization functions (see normalization_cache_stats)
+NORMALIZATION_CACHES = {'word': normalize_word, 'span': normalize_span}
+
+
+def normalization_cache_stats():
+    '''
+    DESCRIPTION: statistics of the normalization caches of this process.
+
+    Returns
+    -------
+    stats: python dict
+        hits, misses, hit rate and number of entries of every cache ('word'
+        and 'span') and of all of them ('total').
+    '''
+    stats = {}
+    for name, function in NORMALIZATION_CACHES.items():
+        info = function.cache_info()
+        stats[name] = {'hits': info.hits, 'misses': info.misses,
+                       'entries': info.currsize}
+    stats['total'] = dict((key, sum(x[key] for x in stats.values())) 
+                          for key in ('hits', 'misses', 'entries'))
+    for x in stats.values():
+        n_lookups = x['hits'] + x['misses']
+        x['hit_rate'] = x['hits'] / n_lookups if n_lookups else 0.0
+    return stats
+
+
+def clear_normalization_caches():
+    for function in NORMALIZATION_CACHES.values():
+        function.cache_clear()
+
+
+def token_offsets(text, tokens):
+    '''
+    DESCRIPTION: obtain the position of every token in the original text in
+    one pass. Tokens must be substrings of text, in text order.
+
+    Parameters
+    ----------
+    text : str
+    tokens : list
+        list of tokens of text (output of tokenize).
+
+    Yields
+    ------
+    token : str
+    start : int
+        position of the token in text.
+    '''
+    pos = 0
+    for token in tokens:
+        start = text.find(token, pos)
+        if start < 0:
+            # The tokenizer modified the token: it cannot be located
+            continue
+        pos = start + len(token)
+        yield token, start
+
             
             
 def adjacent_combs(text, tokens2pos, n_words):
@@ -146,17 +385,299 @@ def argparser():
     parser.add_argument("-d", "--datapath", required = True, dest = "datapath", 
                         help = "path to input text files")
     parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path", 
-                        help = "path to input TSV with codes")
+                        nargs = "+",
+                        help = "path to input TSV with codes. Several " +
+                        "dictionaries (name=path) are matched in one pass, " +
+                        "with one output per dictionary")
     parser.add_argument("-o", "--out_path", required =  True, 
                         dest="out_path", 
                         help = "path to output folder")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "window", choices = ["window", "trie", "hash"],
+                        help = "matching engine for multi-word annotations: " +
+                        "check the surroundings of every token (window), " +
+                        "match all annotations in one pass with a token trie (trie) " +
+                        "or with rolling hashes of token n-grams (hash)")
+    parser.add_argument("-c", "--compiled", required = False, dest = "artifact_path",
+                        default = None,
+                        help = "path to compiled dictionary. It is created " +
+                        "or rebuilt if it is missing or outdated")
+    parser.add_argument("--output_format", required = False, dest = "output_format",
+                        default = "json", choices = ["json", "jsonl"],
+                        help = "output file format: challenge JSON (json) or " +
+                        "one document per line (jsonl)")
+    parser.add_argument("--compression", required = False, dest = "compression",
+                        default = None, choices = ["gz", "xz", "bz2"],
+                        help = "compress output file")
+    parser.add_argument("-w", "--workers", required = False, dest = "workers",
+                        default = 1, type = int,
+                        help = "number of processes scanning articles")
+    parser.add_argument("-t", "--tokenizer", required = False, dest = "tokenizer",
+                        default = "spacy", choices = ["spacy", "regex"],
+                        help = "tokenizer of input texts: spaCy Spanish " +
+                        "tokenizer (spacy) or regular expressions (regex)")
+    parser.add_argument("--stop_words", required = False, dest = "stop_words",
+                        default = "bundled", choices = ["bundled", "spacy"],
+                        help = "Spanish stop words: bundled copy (bundled) " +
+                        "or spaCy list (spacy, imports spaCy)")
+    parser.add_argument("--metrics", required = False, dest = "metrics_path",
+                        default = None,
+                        help = "path to output metrics: one JSON line per " +
+                        "document plus aggregated metrics, or Prometheus text " +
+                        "file if it ends in .prom")
+    parser.add_argument("--profile", required = False, dest = "profile",
+                        action = "store_true",
+                        help = "print the slowest documents and the most " +
+                        "checked dictionary terms")
+    parser.add_argument("--cache", required = False, dest = "cache_path",
+                        default = None,
+                        help = "path to a cache of predictions. Articles " +
+                        "whose text was already scanned with the same " +
+                        "dictionary and configuration are not scanned again")
+    parser.add_argument("--cache_size", required = False, dest = "cache_size",
+                        default = 100000, type = int,
+                        help = "maximum number of texts in the cache (least " +
+                        "recently used ones are evicted)")
+    parser.add_argument("--checkpoint", required = False, dest = "checkpoint_path",
+                        default = None,
+                        help = "path to a journal of scanned articles. If it " +
+                        "exists, the run resumes after the journaled articles. " +
+                        "It is deleted when the run finishes")
+    parser.add_argument("--checkpoint_every", required = False, 
+                        dest = "checkpoint_every", default = 100, type = int,
+                        help = "number of articles between journal writes")
+    parser.add_argument("--async", required = False, dest = "async_pipeline",
+                        action = "store_true",
+                        help = "overlap reading, scanning and writing in an " +
+                        "asyncio pipeline")
+    parser.add_argument("--queue_size", required = False, dest = "queue_size",
+                        default = None, type = int,
+                        help = "maximum number of chunks of articles between " +
+                        "pipeline stages (with --async)")
     args = parser.parse_args()
     
     datapath = args.datapath
-    tsv_path = args.tsv_path
+    try:
+        tsv_path = parse_dictionaries(args.tsv_path)
+    except ValueError as e:
+        parser.error(str(e))
+    if (not isinstance(tsv_path, str)) and (args.artifact_path is not None):
+        parser.error('compiled dictionaries (-c) hold one dictionary')
     out_path = args.out_path
+    engine = args.engine
+    artifact_path = args.artifact_path
+    output_format = args.output_format
+    compression = args.compression
+    workers = args.workers
+    tokenizer = args.tokenizer
+    stop_words = args.stop_words
+    metrics_path = args.metrics_path
+    profile = args.profile
+    cache_path = args.cache_path
+    cache_size = args.cache_size
+    checkpoint_path = args.checkpoint_path
+    checkpoint_every = args.checkpoint_every
+    async_pipeline = args.async_pipeline
+    queue_size = args.queue_size
+    
+    return (datapath, tsv_path, out_path, engine, artifact_path, output_format, 
+            compression, workers, tokenizer, stop_words, metrics_path, profile,
+            cache_path, cache_size, checkpoint_path, checkpoint_every, 
+            async_pipeline, queue_size)
+
+
+def parse_dictionaries(values):
+    '''
+    DESCRIPTION: parse the dictionaries given in the command line.
+
+    Parameters
+    ----------
+    values : list
+        paths to TSV files with codes, optionally preceded by their name
+        (name=path). The name of a TSV without name is its file name 
+        without extension.
+
+    Returns
+    -------
+    tsv_path : str or list
+        path to the TSV if there is one without name, otherwise tuples 
+        (name, path) (see load_tsv_indexes).
+    '''
+    if (len(values) == 1) and ('=' not in values[0]):
+        return values[0]
+    dictionaries = []
+    for value in values:
+        name, sep, path = value.partition('=')
+        if not sep:
+            path = value
+            name = os.path.splitext(os.path.basename(value))[0]
+        dictionaries.append((name, path))
+    names = [name for name, _ in dictionaries]
+    if len(set(names)) != len(names):
+        raise ValueError('dictionary names must be unique: {}'.format(
+            ', '.join(names)))
+    return dictionaries
+
+
+def compile_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the compile subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='compile',
+                                     description='compile the dictionary')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path", 
+                        help = "path to input TSV with codes")
+    parser.add_argument("-c", "--compiled", required = True, dest = "artifact_path",
+                        help = "path to output compiled dictionary")
+    args = parser.parse_args(argv)
+    
+    return args.tsv_path, args.artifact_path
+
+
+def update_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the update subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='update',
+                                     description='apply a delta TSV to a ' +
+                                     'compiled dictionary')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path", 
+                        help = "path to input TSV with codes")
+    parser.add_argument("-c", "--compiled", required = True, dest = "artifact_path",
+                        help = "path to compiled dictionary. It is updated " +
+                        "in place")
+    parser.add_argument("--delta", required = True, dest = "delta_path",
+                        help = "path to delta TSV with columns action " +
+                        "(add, remove or recode), code and span")
+    parser.add_argument("-o", "--out_tsv", required = False, dest = "out_tsv_path",
+                        default = None,
+                        help = "path to updated TSV. If not given, the " +
+                        "input TSV is overwritten")
+    args = parser.parse_args(argv)
+    
+    return args.tsv_path, args.artifact_path, args.delta_path, args.out_tsv_path
+
+
+def serve_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the serve subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='serve',
+                                     description='serve annotation requests')
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path", 
+                        help = "path to input TSV with codes")
+    parser.add_argument("-c", "--compiled", required = False, dest = "artifact_path",
+                        default = None,
+                        help = "path to compiled dictionary. It is created " +
+                        "or rebuilt if it is missing or outdated")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "window", choices = ["window", "trie", "hash"],
+                        help = "matching engine for multi-word annotations")
+    parser.add_argument("-t", "--tokenizer", required = False, dest = "tokenizer",
+                        default = "spacy", choices = ["spacy", "regex"],
+                        help = "tokenizer of input texts")
+    parser.add_argument("--host", required = False, dest = "host",
+                        default = "127.0.0.1", help = "host to listen on")
+    parser.add_argument("--port", required = False, dest = "port",
+                        default = 8000, type = int, help = "port to listen on")
+    parser.add_argument("--socket", required = False, dest = "unix_socket",
+                        default = None,
+                        help = "path to a Unix socket to listen on instead " +
+                        "of host and port")
+    parser.add_argument("--verbose", required = False, dest = "verbose",
+                        action = "store_true", help = "log every request")
+    args = parser.parse_args(argv)
+    
+    return (args.tsv_path, args.artifact_path, args.engine, args.tokenizer, 
+            args.host, args.port, args.unix_socket, args.verbose)
+
+
+def shard_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the shard subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='shard',
+                                     description='split a corpus into shards ' +
+                                     'by article ID hash')
+    parser.add_argument("-d", "--datapath", required = True, dest = "datapath", 
+                        help = "path to input articles")
+    parser.add_argument("-s", "--shard_dir", required = True, dest = "shard_dir",
+                        help = "path to output shard directory")
+    parser.add_argument("-n", "--n_shards", required = True, dest = "n_shards",
+                        type = int, help = "number of shards")
+    parser.add_argument("--compression", required = False, dest = "compression",
+                        default = None, choices = ["gz", "xz", "bz2"],
+                        help = "compress the shards")
+    args = parser.parse_args(argv)
+    
+    return args.datapath, args.shard_dir, args.n_shards, args.compression
+
+
+def work_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the work subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='work',
+                                     description='annotate the shards not ' +
+                                     'claimed by other workers')
+    parser.add_argument("-s", "--shard_dir", required = True, dest = "shard_dir",
+                        help = "path to shard directory")
+    parser.add_argument("-i", "--tsv_path", required = True, dest = "tsv_path", 
+                        help = "path to input TSV with codes")
+    parser.add_argument("-c", "--compiled", required = False, dest = "artifact_path",
+                        default = None,
+                        help = "path to compiled dictionary. It is created " +
+                        "or rebuilt if it is missing or outdated")
+    parser.add_argument("-e", "--engine", required = False, dest = "engine",
+                        default = "window", choices = ["window", "trie", "hash"],
+                        help = "matching engine for multi-word annotations")
+    parser.add_argument("-t", "--tokenizer", required = False, dest = "tokenizer",
+                        default = "spacy", choices = ["spacy", "regex"],
+                        help = "tokenizer of input texts")
+    parser.add_argument("-w", "--workers", required = False, dest = "workers",
+                        default = 1, type = int,
+                        help = "number of processes scanning the articles " +
+                        "of every shard")
+    parser.add_argument("--worker_id", required = False, dest = "worker_id",
+                        default = None,
+                        help = "name of the worker in the claims (default: " +
+                        "host name and process ID)")
+    parser.add_argument("--stale_after", required = False, dest = "stale_after",
+                        default = None, type = float,
+                        help = "seconds after which the claim of a shard " +
+                        "that is not refreshed is taken over")
+    args = parser.parse_args(argv)
+    
+    return (args.shard_dir, args.tsv_path, args.artifact_path, args.engine, 
+            args.tokenizer, args.workers, args.worker_id, args.stale_after)
+
+
+def merge_argparser(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments of the merge subcommand
+    '''
+    
+    parser = argparse.ArgumentParser(prog='merge',
+                                     description='merge the outputs of all ' +
+                                     'shards')
+    parser.add_argument("-s", "--shard_dir", required = True, dest = "shard_dir",
+                        help = "path to shard directory")
+    parser.add_argument("-o", "--out_path", required = True, dest = "out_path",
+                        help = "path to output folder")
+    parser.add_argument("--output_format", required = False, dest = "output_format",
+                        default = "json", choices = ["json", "jsonl"],
+                        help = "output file format")
+    parser.add_argument("--compression", required = False, dest = "compression",
+                        default = None, choices = ["gz", "xz", "bz2"],
+                        help = "compress output file")
+    args = parser.parse_args(argv)
     
-    return datapath, tsv_path, out_path
+    return args.shard_dir, args.out_path, args.output_format, args.compression
 
 
 def strip_punct(m_end, m_start, m_group, exit_bool):
@@ -229,7 +750,7 @@ def normalize_str(annot, min_upper):
     annot_bs = re.sub('\s+', ' ', annot_lower).strip()
 
     # Remove punctuation
-    annot_punct = annot_bs.translate(str.maketrans('', '', string.punctuation))
+    annot_punct = annot_bs.translate(PUNCT_TABLE)
     
     # Remove accents
     annot_processed = remove_accents(annot_punct)
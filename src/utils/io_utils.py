@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 11:02:17 2026
+
+Streaming input and output of MESINESP JSON files
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+from utils.app_specific_utils import label_source
+
+# Number of characters read from the input file every time
+CHUNK_SIZE = 1 << 16
+
+JSON_DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+
+
+def open_text(path, mode='r'):
+    '''
+    DESCRIPTION: open a text file, decompressing or compressing it if its
+    extension is .gz, .xz or .bz2.
+
+    Parameters
+    ----------
+    path: str
+    mode: str
+        'r' to read, 'w' to write.
+
+    Returns
+    -------
+    f: file object in text mode.
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.xz'):
+        return lzma.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def is_jsonl(path):
+    '''
+    DESCRIPTION: check whether a path is a JSON Lines file (one JSON object
+    per line), ignoring the compression extension.
+    '''
+    for ext in ('.gz', '.xz', '.bz2'):
+        if path.endswith(ext):
+            path = path[:-len(ext)]
+    return path.endswith('.jsonl')
+
+
+def iter_articles(datapath):
+    '''
+    DESCRIPTION: yield the articles of a MESINESP JSON file one at a time,
+    without loading the whole file in memory.
+
+    Parameters
+    ----------
+    datapath: str
+        path to a JSON file with the layout {"articles": [{...}, ...]} or to
+        a JSON Lines file (.jsonl) with one article per line. Both can be
+        compressed (.gz, .xz, .bz2).
+
+    Yields
+    ------
+    article: python dict
+        with (at least) keys 'id' and 'abstractText'.
+    '''
+    with open_text(datapath) as f:
+        if is_jsonl(datapath):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_articles(f)
+
+
+def iter_json_articles(f, key='articles'):
+    '''
+    DESCRIPTION: incremental parser of a JSON object {key: [{...}, ...], ...}.
+    It only keeps in memory the article being decoded (plus one chunk of
+    text). Other keys of the top-level object are decoded and ignored.
+
+    Parameters
+    ----------
+    f: file object in text mode.
+    key: str
+        key of the list of articles.
+
+    Yields
+    ------
+    article: python dict
+    '''
+    reader = _JSONReader(f)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        current_key = reader.decode()
+        reader.expect(':')
+        if current_key == key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            reader.decode()
+        if reader.expect(',}') == '}':
+            return
+
+
+class _JSONReader():
+    '''
+    DESCRIPTION: buffered reader of JSON values from a text file object.
+    '''
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        # Drop the consumed part of the buffer and append a new chunk
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        '''
+        DESCRIPTION: skip whitespaces and return the next character ('' at
+        the end of the file).
+        '''
+        while True:
+            while (self.pos < len(self.buffer)) and (self.buffer[self.pos] in WHITESPACE):
+                self.pos = self.pos + 1
+            if (self.pos < len(self.buffer)) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._read()
+
+    def expect(self, chars):
+        '''
+        DESCRIPTION: consume the next character, that must be one of chars.
+        '''
+        char = self.peek()
+        if (char == '') or (char not in chars):
+            raise ValueError('Malformed JSON: expected one of {!r}, found {!r}'.format(chars, char))
+        self.pos = self.pos + 1
+        return char
+
+    def decode(self):
+        '''
+        DESCRIPTION: decode the next JSON value, reading more chunks until it
+        is complete.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = JSON_DECODER.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may be truncated
+                if (end < len(self.buffer)) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+
+def output_file_name(output_format='json', compression=None):
+    '''
+    DESCRIPTION: name of the output file for an output format and compression.
+
+    Parameters
+    ----------
+    output_format: str
+        'json' (challenge format, {"documents": [...]}) or 'jsonl' (one
+        document per line).
+    compression: str
+        None, 'gz', 'xz' or 'bz2'.
+
+    Returns
+    -------
+    name: str
+    '''
+    name = 'output_file.' + output_format
+    if compression is not None:
+        name = name + '.' + compression
+    return name
+
+
+def prediction_codes(predictions):
+    '''
+    DESCRIPTION: obtain the unique codes of a list of predictions, in order
+    of appearance.
+
+    Parameters
+    ----------
+    predictions: Predictions or list
+        predictions [span, off0, off1, label, code].
+
+    Returns
+    -------
+    codes: list
+    '''
+    if hasattr(predictions, 'unique_codes'):
+        # Compact predictions: no span text is sliced (see span_utils.py)
+        return predictions.unique_codes()
+    return list(dict.fromkeys(map(lambda x: x[-1], predictions)))
+
+
+def prediction_codes_by_source(predictions, sources):
+    '''
+    DESCRIPTION: obtain the unique codes of a list of predictions of every
+    source dictionary (see load_tsv_indexes), in order of appearance. They
+    are the codes found with every dictionary alone.
+
+    Parameters
+    ----------
+    predictions: Predictions or list
+        predictions [span, off0, off1, label, code].
+    sources: iterable
+        names of the source dictionaries.
+
+    Returns
+    -------
+    source2codes: python dict
+        It relates every source with the list of its codes.
+    '''
+    source2codes = dict((source, {}) for source in sources)
+    if hasattr(predictions, 'label_ids'):
+        # Compact predictions: no span text is sliced (see span_utils.py)
+        sources = [label_source(label) for label in predictions.labels]
+        codes = predictions.codes
+        for label_id, code_id in zip(predictions.label_ids, predictions.code_ids):
+            source2codes[sources[label_id]][codes[code_id]] = None
+    else:
+        for prediction in predictions:
+            source2codes[label_source(prediction[3])][prediction[4]] = None
+    return dict((source, list(codes)) for source, codes in source2codes.items())
+
+
+class AnnotationWriter():
+    '''
+    DESCRIPTION: write the {"id", "labels"} record of every document as soon
+    as it is available, instead of keeping all of them in memory.
+
+    In 'json' format the file is the challenge format {"documents": [...]}
+    (same bytes as json.dump of the whole dict). In 'jsonl' format every
+    line is one record, so the file is readable even if the run is killed.
+    The output is compressed if path ends in .gz, .xz or .bz2. If the with
+    block raises, the 'json' document is left unclosed, so an incomplete
+    output is never taken for a complete one.
+
+    Usage:
+        with AnnotationWriter(path) as writer:
+            writer.write(_id, labels)
+    '''
+
+    # Flush the file every FLUSH_EVERY records
+    FLUSH_EVERY = 100
+
+    def __init__(self, path, output_format='json'):
+        if output_format not in ('json', 'jsonl'):
+            raise ValueError('Unknown output format: {}'.format(output_format))
+        self.path = path
+        self.output_format = output_format
+        self.n_records = 0
+        self.f = open_text(path, 'w')
+        if output_format == 'json':
+            self.f.write('{"documents": [')
+
+    def write(self, _id, labels):
+        record = json.dumps({'id': _id, 'labels': labels})
+        if self.output_format == 'jsonl':
+            self.f.write(record + '\n')
+        elif self.n_records == 0:
+            self.f.write(record)
+        else:
+            self.f.write(', ' + record)
+        self.n_records = self.n_records + 1
+        if self.n_records % self.FLUSH_EVERY == 0:
+            self.f.flush()
+
+    def write_predictions(self, _id, predictions):
+        '''
+        DESCRIPTION: write the codes of the predictions of a document.
+        '''
+        self.write(_id, prediction_codes(predictions))
+
+    def close(self):
+        if self.f.closed:
+            return
+        if self.output_format == 'json':
+            self.f.write(']}')
+        self.f.close()
+
+    def abort(self):
+        '''
+        DESCRIPTION: close the file without closing the JSON document.
+        '''
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class SourceWriter():
+    '''
+    DESCRIPTION: write the output of every source dictionary (see 
+    load_tsv_indexes) to its own file, as AnnotationWriter: the file of a 
+    dictionary is the output of a run with that dictionary alone.
+
+    Usage:
+        with SourceWriter({'decs': path1, 'drugs': path2}) as writer:
+            writer.write_predictions(_id, predictions)
+    '''
+
+    def __init__(self, paths, output_format='json'):
+        self.writers = {}
+        try:
+            for source, path in paths.items():
+                self.writers[source] = AnnotationWriter(path, output_format)
+        except BaseException:
+            self.abort()
+            raise
+
+    def write_predictions(self, _id, predictions):
+        '''
+        DESCRIPTION: write the codes of the predictions of a document of 
+        every source.
+        '''
+        source2codes = prediction_codes_by_source(predictions, self.writers)
+        for source, writer in self.writers.items():
+            writer.write(_id, source2codes[source])
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 10:12:40 2026
+
+Alternative matching engines for multi-word annotations
+"""
+
+import re
+import string
+from utils.general_utils import ACCENT_TABLE, LOWER_ACCENT_TABLE, PUNCT_TABLE
+
+# Key of the trie nodes where the IDs of the annotations that end there are stored
+TERM_KEY = None
+
+
+def build_term_trie(id2annot_info):
+    '''
+    DESCRIPTION: compile the normalized multi-word annotations into a
+    token-level trie.
+
+    Parameters
+    ----------
+    id2annot_info: list
+        Annotation information indexed by annotation ID (see
+        format_input_info).
+
+    Returns
+    -------
+    term_trie: python dict
+        Nested dicts {token: child node}. The IDs of the annotations that
+        end in a node are stored in it under the key TERM_KEY.
+    '''
+    term_trie = {}
+    for annot_id, info in enumerate(id2annot_info):
+        if info[4] >= 2:
+            trie_add(term_trie, annot_id, info[5])
+
+    return term_trie
+
+
+def trie_add(term_trie, annot_id, annot_processed):
+    '''
+    DESCRIPTION: add a multi-word annotation to a term trie.
+    '''
+    node = term_trie
+    for token in annot_processed.split(' '):
+        node = node.setdefault(token, {})
+    node.setdefault(TERM_KEY, []).append(annot_id)
+
+
+def trie_remove(term_trie, annot_id, annot_processed):
+    '''
+    DESCRIPTION: remove a multi-word annotation from a term trie, and the 
+    nodes left empty.
+    '''
+    path = [term_trie]
+    for token in annot_processed.split(' '):
+        node = path[-1].get(token)
+        if node is None:
+            return
+        path.append(node)
+    annot_ids = path[-1].get(TERM_KEY, [])
+    if annot_id not in annot_ids:
+        return
+    annot_ids.remove(annot_id)
+    if not annot_ids:
+        del path[-1][TERM_KEY]
+    for token, parent, node in zip(reversed(annot_processed.split(' ')),
+                                   reversed(path[:-1]), reversed(path[1:])):
+        if node:
+            break
+        del parent[token]
+
+
+def tokenize_for_matching(txt):
+    '''
+    DESCRIPTION: split text into tokens the same way tokenize_span does
+    (whitespace separated, punctuation-only tokens discarded, initial and
+    final punctuation removed) and normalize every token.
+
+    Parameters
+    ----------
+    txt: str
+
+    Returns
+    -------
+    tokens: list
+        Every element is a tuple (start, end, token lowercased and
+        normalized, token normalized without lowercasing).
+    '''
+    tokens = []
+    for m in re.finditer(r'\S+', txt):
+        m_group = m.group()
+        m_trim = m_group.lstrip(string.punctuation)
+        if not m_trim:
+            continue
+        m_start = m.start() + len(m_group) - len(m_trim)
+        m_trim = m_trim.rstrip(string.punctuation)
+        m_end = m_start + len(m_trim)
+        token_raw = m_trim.translate(PUNCT_TABLE)
+        tokens.append((m_start, m_end, token_raw.translate(LOWER_ACCENT_TABLE),
+                       token_raw.translate(ACCENT_TABLE)))
+    return tokens
+
+
+def find_trie_matches(txt, term_trie, min_upper):
+    '''
+    DESCRIPTION: find all the multi-word annotations of the trie in the text
+    in one pass over the normalized token stream.
+
+    Token combinations are normalized as in normalize_tokens: they are only
+    lowercased if the whole combination is longer than min_upper characters.
+
+    Parameters
+    ----------
+    txt: str
+    term_trie: python dict
+        Output of build_term_trie.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+
+    Returns
+    -------
+    annot_id2spans: python dict
+        It relates every annotation ID found in text with the list of its
+        positions in text (start, end), in text order.
+    '''
+    annot_id2spans = {}
+    tokens = tokenize_for_matching(txt)
+    n_tokens = len(tokens)
+
+    for a in range(n_tokens):
+        # Walk the trie twice: with lowercased tokens (valid for combinations
+        # longer than min_upper) and with the tokens as they are (valid for
+        # shorter combinations)
+        for lowercased in (True, False):
+            node = term_trie
+            n_chars = -1
+            for b in range(a, n_tokens):
+                start, end, token_lower, token_raw = tokens[b]
+                n_chars = n_chars + (end - start) + 1
+                if (lowercased == False) & (n_chars > min_upper):
+                    break
+                node = node.get(token_lower if lowercased else token_raw)
+                if node is None:
+                    break
+                if (TERM_KEY in node) & ((n_chars > min_upper) == lowercased):
+                    for annot_id in node[TERM_KEY]:
+                        if annot_id in annot_id2spans:
+                            annot_id2spans[annot_id].append((tokens[a][0], end))
+                        else:
+                            annot_id2spans[annot_id] = [(tokens[a][0], end)]
+
+    return annot_id2spans
+
+
+# Rolling hash of token ID sequences: polynomial hash modulo a Mersenne prime
+NGRAM_HASH_BASE = 1000003
+NGRAM_HASH_MOD = (1 << 61) - 1
+
+
+class NgramIndex():
+    '''
+    DESCRIPTION: hash set of the normalized token n-grams of the multi-word
+    annotations (see build_ngram_index and find_ngram_matches).
+
+    Attributes
+    ----------
+    vocabulary: python dict
+        It relates every token of the annotations with an integer ID (> 0).
+    ngrams: python dict
+        It relates the rolling hash of every annotation (a sequence of token
+        IDs) with a list of (token IDs, annotation IDs). Token IDs are
+        compared on every hit, so hash collisions never produce matches.
+    max_n: int
+        number of tokens of the longest annotation.
+    '''
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.ngrams = {}
+        self.max_n = 0
+
+
+def build_ngram_index(id2annot_info):
+    '''
+    DESCRIPTION: compile the normalized multi-word annotations into a hash
+    set of token n-grams.
+
+    Parameters
+    ----------
+    id2annot_info: list
+        Annotation information indexed by annotation ID (see
+        format_input_info).
+
+    Returns
+    -------
+    ngram_index: NgramIndex
+    '''
+    ngram_index = NgramIndex()
+    for annot_id, info in enumerate(id2annot_info):
+        if info[4] >= 2:
+            ngram_add(ngram_index, annot_id, info[5])
+
+    return ngram_index
+
+
+def ngram_hash(token_ids):
+    '''
+    DESCRIPTION: rolling hash of a sequence of token IDs.
+    '''
+    h = 0
+    for token_id in token_ids:
+        h = (h * NGRAM_HASH_BASE + token_id) % NGRAM_HASH_MOD
+    return h
+
+
+def ngram_add(ngram_index, annot_id, annot_processed):
+    '''
+    DESCRIPTION: add a multi-word annotation to an n-gram index.
+    '''
+    vocabulary = ngram_index.vocabulary
+    token_ids = tuple(vocabulary.setdefault(token, len(vocabulary) + 1)
+                      for token in annot_processed.split(' '))
+    ngram_index.max_n = max(ngram_index.max_n, len(token_ids))
+    candidates = ngram_index.ngrams.setdefault(ngram_hash(token_ids), [])
+    for candidate_ids, annot_ids in candidates:
+        if candidate_ids == token_ids:
+            annot_ids.append(annot_id)
+            return
+    candidates.append((token_ids, [annot_id]))
+
+
+def ngram_remove(ngram_index, annot_id, annot_processed):
+    '''
+    DESCRIPTION: remove a multi-word annotation from an n-gram index. Its 
+    tokens stay in the vocabulary.
+    '''
+    token_ids = tuple(ngram_index.vocabulary.get(token, 0)
+                      for token in annot_processed.split(' '))
+    h = ngram_hash(token_ids)
+    candidates = ngram_index.ngrams.get(h, [])
+    for i, (candidate_ids, annot_ids) in enumerate(candidates):
+        if (candidate_ids == token_ids) & (annot_id in annot_ids):
+            annot_ids.remove(annot_id)
+            if not annot_ids:
+                del candidates[i]
+            if not candidates:
+                del ngram_index.ngrams[h]
+            return
+
+
+def find_ngram_matches(txt, ngram_index, min_upper):
+    '''
+    DESCRIPTION: find all the multi-word annotations of the n-gram index in
+    the text. The normalized token sequence of the text is hashed once: the
+    hash of every n-gram extends the hash of the previous one, so the cost
+    is O(tokens x max_n) whatever the number of annotations.
+
+    Same normalization and output as find_trie_matches.
+
+    Parameters
+    ----------
+    txt: str
+    ngram_index: NgramIndex
+        Output of build_ngram_index.
+    min_upper: int.
+        It specifies the minimum number of characters of a word to lowercase
+        it (to prevent mistakes with acronyms).
+
+    Returns
+    -------
+    annot_id2spans: python dict
+        It relates every annotation ID found in text with the list of its
+        positions in text (start, end), in text order.
+    '''
+    annot_id2spans = {}
+    vocabulary = ngram_index.vocabulary
+    ngrams = ngram_index.ngrams
+    max_n = ngram_index.max_n
+    tokens = tokenize_for_matching(txt)
+    n_tokens = len(tokens)
+    # Token IDs (0 if the token is in no annotation) with and without
+    # lowercasing
+    ids_lower = [vocabulary.get(token[2], 0) for token in tokens]
+    ids_raw = [vocabulary.get(token[3], 0) for token in tokens]
+
+    for a in range(n_tokens):
+        # Lowercased n-grams are valid if longer than min_upper characters,
+        # n-grams as they are otherwise (see normalize_tokens)
+        for lowercased, token_ids in ((True, ids_lower), (False, ids_raw)):
+            h = 0
+            n_chars = -1
+            for b in range(a, min(a + max_n, n_tokens)):
+                start, end = tokens[b][0], tokens[b][1]
+                n_chars = n_chars + (end - start) + 1
+                if (lowercased == False) & (n_chars > min_upper):
+                    break
+                token_id = token_ids[b]
+                if token_id == 0:
+                    # No annotation contains this token
+                    break
+                h = (h * NGRAM_HASH_BASE + token_id) % NGRAM_HASH_MOD
+                if (b == a) | ((n_chars > min_upper) != lowercased):
+                    continue
+                candidates = ngrams.get(h)
+                if candidates is None:
+                    continue
+                ngram = tuple(token_ids[a:b+1])
+                for candidate_ids, annot_ids in candidates:
+                    if candidate_ids != ngram:
+                        continue
+                    for annot_id in annot_ids:
+                        if annot_id in annot_id2spans:
+                            annot_id2spans[annot_id].append((tokens[a][0], end))
+                        else:
+                            annot_id2spans[annot_id] = [(tokens[a][0], end)]
+
+    return annot_id2spans
+
+
+def build_term_index(id2annot_info, engine):
+    '''
+    DESCRIPTION: build the structure used to match multi-word annotations
+    with an engine.
+
+    Parameters
+    ----------
+    id2annot_info: list
+    engine: str
+        'window' (no structure), 'trie' or 'hash'.
+
+    Returns
+    -------
+    term_index: python dict (trie), NgramIndex (hash) or None (window)
+    '''
+    if engine == 'trie':
+        return build_term_trie(id2annot_info)
+    if engine == 'hash':
+        return build_ngram_index(id2annot_info)
+    if engine == 'window':
+        return None
+    raise ValueError('Unknown engine: {}'.format(engine))
+
+
+def find_term_matches(txt, term_index, min_upper):
+    '''
+    DESCRIPTION: find all the multi-word annotations of a term trie or an
+    n-gram index in the text (see find_trie_matches and find_ngram_matches).
+    '''
+    if isinstance(term_index, NgramIndex):
+        return find_ngram_matches(txt, term_index, min_upper)
+    return find_trie_matches(txt, term_index, min_upper)
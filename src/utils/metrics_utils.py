@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:26 2026
+
+Opt-in instrumentation of the detection pipeline
+"""
+
+import collections
+import heapq
+import json
+
+# Counters filled by scan_one_file for every document. tokens are the words
+# of the text kept by format_text_info (no stopwords nor 1-char words).
+# normalization_hits and normalization_misses are the lookups of the 
+# normalization caches (see normalization_cache_stats)
+DOC_COUNTERS = ['tokens', 'unique_tokens', 'candidate_tokens',
+                'annotations_checked', 'check_surroundings_calls',
+                'hits', 'misses', 'predictions', 'normalization_hits',
+                'normalization_misses']
+
+# Stages timed by scan_one_file for every document (seconds)
+DOC_STAGES = ['trie_matching', 'format_text_info', 'matching', 'dedupe', 'total']
+
+
+def new_doc_metrics(profile=False):
+    '''
+    DESCRIPTION: empty metrics of a document, to be filled by scan_one_file.
+
+    Parameters
+    ----------
+    profile : bool
+        also count the checks of every annotation (key 'annot_checks').
+
+    Returns
+    -------
+    doc_metrics : python dict
+    '''
+    doc_metrics = dict.fromkeys(DOC_COUNTERS, 0)
+    doc_metrics['seconds'] = dict.fromkeys(DOC_STAGES, 0.0)
+    if profile:
+        doc_metrics['annot_checks'] = collections.Counter()
+    return doc_metrics
+
+
+class MetricsCollector():
+    '''
+    DESCRIPTION: aggregate the metrics of every document and write them.
+
+    If path ends in .prom, aggregated metrics are written at the end in
+    Prometheus text format. Otherwise, one JSON line is written per document
+    as soon as it is added, and a final line with the aggregated metrics
+    ({"aggregate": {...}}).
+    In profile mode, the slowest documents and the most checked dictionary
+    terms are kept and can be printed with report_profile.
+
+    Usage:
+        with MetricsCollector(path, profile) as metrics:
+            doc_metrics = metrics.new_doc_metrics()
+            ... scan_one_file(..., metrics=doc_metrics)
+            metrics.add_document(_id, doc_metrics)
+    '''
+
+    def __init__(self, path=None, profile=False, n_top=20):
+        self.path = path
+        self.profile = profile
+        self.n_top = n_top
+        self.n_documents = 0
+        self.counters = dict.fromkeys(DOC_COUNTERS, 0)
+        self.seconds = dict.fromkeys(DOC_STAGES, 0.0)
+        self.slowest = []
+        self.annot_checks = collections.Counter()
+        self.f = None
+        if (path is not None) and (not path.endswith('.prom')):
+            self.f = open(path, 'w')
+
+    def new_doc_metrics(self):
+        return new_doc_metrics(self.profile)
+
+    def add_document(self, _id, doc_metrics):
+        '''
+        DESCRIPTION: add the metrics of a document (filled by scan_one_file).
+        '''
+        self.n_documents = self.n_documents + 1
+        for counter in DOC_COUNTERS:
+            self.counters[counter] = self.counters[counter] + doc_metrics[counter]
+        for stage in DOC_STAGES:
+            self.seconds[stage] = self.seconds[stage] + doc_metrics['seconds'][stage]
+
+        if self.profile:
+            annot_checks = doc_metrics.pop('annot_checks', None)
+            if annot_checks:
+                self.annot_checks.update(annot_checks)
+            # Min-heap with the n_top slowest documents
+            item = (doc_metrics['seconds']['total'], self.n_documents, _id)
+            if len(self.slowest) < self.n_top:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+        if self.f is not None:
+            record = {'id': _id}
+            record.update(doc_metrics)
+            self.f.write(json.dumps(record) + '\n')
+
+    def aggregate(self):
+        '''
+        DESCRIPTION: aggregated metrics of all documents added.
+        '''
+        total = self.seconds['total']
+        checked = self.counters['annotations_checked']
+        normalized = (self.counters['normalization_hits'] + 
+                      self.counters['normalization_misses'])
+        return {'documents': self.n_documents,
+                'counters': dict(self.counters),
+                'seconds': dict(self.seconds),
+                'docs_per_sec': self.n_documents / total if total > 0 else 0.0,
+                'hit_rate': self.counters['hits'] / checked if checked else 0.0,
+                'normalization_hit_rate': (self.counters['normalization_hits'] / 
+                                           normalized if normalized else 0.0)}
+
+    def prometheus_text(self):
+        '''
+        DESCRIPTION: aggregated metrics in Prometheus text format.
+        '''
+        lines = ['# HELP mesinesp_documents_total Documents scanned.',
+                 '# TYPE mesinesp_documents_total counter',
+                 'mesinesp_documents_total {}'.format(self.n_documents)]
+        for counter in DOC_COUNTERS:
+            name = 'mesinesp_{}_total'.format(counter)
+            lines.append('# TYPE {} counter'.format(name))
+            lines.append('{} {}'.format(name, self.counters[counter]))
+        lines.append('# HELP mesinesp_stage_seconds_total Time spent in every stage of scan_one_file.')
+        lines.append('# TYPE mesinesp_stage_seconds_total counter')
+        for stage in DOC_STAGES:
+            lines.append('mesinesp_stage_seconds_total{{stage="{}"}} {}'.format(
+                stage, self.seconds[stage]))
+        return '\n'.join(lines) + '\n'
+
+    def report_profile(self, id2annot_info, n=None):
+        '''
+        DESCRIPTION: text with the slowest documents and the dictionary terms
+        checked most times.
+        '''
+        n = self.n_top if n is None else n
+        lines = ['Slowest documents:']
+        for seconds, _, _id in sorted(self.slowest, reverse=True)[:n]:
+            lines.append('  {:10.2f} ms  {}'.format(seconds * 1000, _id))
+        lines.append('Most checked dictionary terms:')
+        for annot_id, checks in self.annot_checks.most_common(n):
+            lines.append('  {:10d}  {}'.format(checks, id2annot_info[annot_id][0]))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.f is not None:
+            if not self.f.closed:
+                self.f.write(json.dumps({'aggregate': self.aggregate()}) + '\n')
+                self.f.close()
+        elif (self.path is not None) and self.path.endswith('.prom'):
+            with open(self.path, 'w') as f:
+                f.write(self.prometheus_text())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
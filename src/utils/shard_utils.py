@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:12:07 2026
+
+Sharded runs: split a corpus into shards, annotate the shards from any
+number of processes or machines sharing the shard directory, and merge the
+outputs.
+
+Shard directory:
+    manifest.json     shards and their number of articles
+    shards/           input shards (JSON Lines, {"index", "id", "abstractText"})
+    claims/           one file per shard being annotated
+    journals/         checkpoint journal of every shard being annotated
+    outputs/          output of every annotated shard ({"id", "labels"} per
+                      line) and its metadata
+"""
+
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import socket
+import time
+from utils.io_utils import AnnotationWriter, iter_articles, open_text, prediction_codes
+from utils.checkpoint_utils import Checkpoint
+
+MANIFEST_VERSION = 1
+
+# Claims of shards being annotated are refreshed every HEARTBEAT_EVERY articles
+HEARTBEAT_EVERY = 100
+
+
+def shard_of(_id, n_shards):
+    '''
+    DESCRIPTION: shard of an article: hash of its ID modulo the number of
+    shards. Deterministic across runs, processes and machines.
+    '''
+    digest = hashlib.sha1(str(_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % n_shards
+
+
+def shard_name(n):
+    return 'shard-{:05d}'.format(n)
+
+
+def tmp_path_of(path):
+    # Temporary file in the same directory, with the same extension (it 
+    # selects the compression)
+    directory, name = os.path.split(path)
+    return os.path.join(directory, '.tmp-{}-{}'.format(os.getpid(), name))
+
+
+def write_json_atomic(obj, path):
+    tmp_path = tmp_path_of(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(shard_dir):
+    with open(os.path.join(shard_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError('{}: unsupported manifest version {}'.format(
+            shard_dir, manifest.get('version')))
+    return manifest
+
+
+def split_corpus(datapath, shard_dir, n_shards, compression=None):
+    '''
+    DESCRIPTION: split a corpus into n_shards shards by article ID hash
+    (see shard_of) and write the manifest. Articles with the same ID are in
+    the same shard. Every shard keeps the position of its articles in the
+    input, so merge_shards writes them in input order.
+
+    Parameters
+    ----------
+    datapath : str
+        path to input articles (see iter_articles).
+    shard_dir : str
+        output directory. All shard files are open at the same time.
+    n_shards : int
+    compression : str
+        None, 'gz', 'xz' or 'bz2': compression of the shards.
+
+    Returns
+    -------
+    manifest : python dict
+    '''
+    os.makedirs(os.path.join(shard_dir, 'shards'), exist_ok=True)
+    extension = '.jsonl' if compression is None else '.jsonl.' + compression
+    shards = [{'name': shard_name(n),
+               'path': os.path.join('shards', shard_name(n) + extension),
+               'articles': 0} for n in range(n_shards)]
+    files = [open_text(os.path.join(shard_dir, shard['path']), 'w')
+             for shard in shards]
+    try:
+        n_articles = 0
+        for index, article in enumerate(iter_articles(datapath)):
+            n = shard_of(article['id'], n_shards)
+            files[n].write(json.dumps({'index': index, 'id': article['id'],
+                                       'abstractText': article['abstractText']},
+                                      ensure_ascii=False) + '\n')
+            shards[n]['articles'] = shards[n]['articles'] + 1
+            n_articles = n_articles + 1
+    finally:
+        for f in files:
+            f.close()
+
+    manifest = {'version': MANIFEST_VERSION,
+                'datapath': os.path.abspath(datapath),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'n_shards': n_shards,
+                'n_articles': n_articles,
+                'shards': shards}
+    write_json_atomic(manifest, os.path.join(shard_dir, 'manifest.json'))
+    return manifest
+
+
+def claim_shard(claim_path, owner, stale_after=None):
+    '''
+    DESCRIPTION: claim a shard by creating its claim file (atomic on shared
+    storage). A claim not refreshed for stale_after seconds (its owner died)
+    is taken over: it is renamed first, so only one worker takes it over.
+
+    Returns
+    -------
+    claimed : bool
+    '''
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            age = time.time() - os.stat(claim_path).st_mtime
+        except FileNotFoundError:
+            return False
+        if (stale_after is None) or (age < stale_after):
+            return False
+        stale_path = '{}.stale-{}'.format(claim_path, owner)
+        try:
+            os.rename(claim_path, stale_path)
+        except FileNotFoundError:
+            return False
+        os.remove(stale_path)
+        return claim_shard(claim_path, owner)
+    with os.fdopen(fd, 'w') as f:
+        f.write(owner + '\n')
+    return True
+
+
+def annotate_shard(shard_dir, shard, annotate, fingerprint, claim_path, owner):
+    '''
+    DESCRIPTION: annotate the articles of a shard and write its output and
+    metadata. The output is written to a temporary file and renamed, so it
+    only exists once complete. Scanned articles are journaled: if the shard
+    is taken over, the new owner resumes after them, unless it annotates with
+    another fingerprint: then the journal is discarded.
+
+    Parameters
+    ----------
+    annotate : function
+        annotate(datapath, checkpoint) yields (id, predictions) of every
+        article (see iter_annots).
+    fingerprint : str
+        configuration of the annotation (see cache_fingerprint).
+    claim_path : str
+        claim of the shard, refreshed every HEARTBEAT_EVERY articles.
+    owner : str
+        name of the worker.
+
+    Returns
+    -------
+    n_articles : int
+    '''
+    for sub_dir in ('journals', 'outputs'):
+        os.makedirs(os.path.join(shard_dir, sub_dir), exist_ok=True)
+    name = shard['name']
+    out_file = os.path.join(shard_dir, 'outputs', name + '.jsonl')
+    tmp_file = tmp_path_of(out_file)
+    n_articles = 0
+    with Checkpoint(os.path.join(shard_dir, 'journals', name + '.journal'),
+                    fingerprint) as checkpoint, \
+         AnnotationWriter(tmp_file, 'jsonl') as writer:
+        for _id, predictions in annotate(os.path.join(shard_dir, shard['path']),
+                                         checkpoint):
+            writer.write(_id, prediction_codes(predictions))
+            n_articles = n_articles + 1
+            if n_articles % HEARTBEAT_EVERY == 0:
+                os.utime(claim_path)
+    write_json_atomic({'fingerprint': fingerprint, 'articles': n_articles,
+                       'owner': owner},
+                      os.path.join(shard_dir, 'outputs', name + '.meta.json'))
+    os.replace(tmp_file, out_file)
+    checkpoint.remove()
+    return n_articles
+
+
+def work_shards(shard_dir, annotate, fingerprint, owner=None, stale_after=None):
+    '''
+    DESCRIPTION: claim and annotate the shards without output until none is
+    left. Any number of workers (processes or machines sharing shard_dir)
+    can run at the same time.
+
+    Parameters
+    ----------
+    shard_dir : str
+    annotate : function
+        see annotate_shard.
+    fingerprint : str
+        see annotate_shard.
+    owner : str
+        name of the worker. Default: host name and process ID.
+    stale_after : float
+        seconds after which the claim of a worker that stopped refreshing
+        it is taken over. It must be longer than the time to annotate 
+        HEARTBEAT_EVERY articles. None: claims are never taken over.
+
+    Returns
+    -------
+    annotated : list
+        names of the shards annotated by this worker.
+    '''
+    manifest = read_manifest(shard_dir)
+    owner = '{}-{}'.format(socket.gethostname(), os.getpid()) if owner is None else owner
+    os.makedirs(os.path.join(shard_dir, 'claims'), exist_ok=True)
+    # Workers start at different shards to reduce contention on the claims
+    shards = manifest['shards']
+    start = shard_of(owner, len(shards))
+    annotated = []
+    for shard in shards[start:] + shards[:start]:
+        out_file = os.path.join(shard_dir, 'outputs', shard['name'] + '.jsonl')
+        if os.path.exists(out_file):
+            continue
+        claim_path = os.path.join(shard_dir, 'claims', shard['name'] + '.claim')
+        if not claim_shard(claim_path, owner, stale_after):
+            continue
+        try:
+            # The shard may have been finished between the check and the claim
+            if not os.path.exists(out_file):
+                annotate_shard(shard_dir, shard, annotate, fingerprint, 
+                               claim_path, owner)
+                annotated.append(shard['name'])
+        finally:
+            try:
+                os.remove(claim_path)
+            except FileNotFoundError:
+                # Taken over by another worker
+                pass
+    return annotated
+
+
+def iter_shard_output(shard_dir, shard, duplicates):
+    # Yield (index, id, labels) of the articles of a shard, checking that the
+    # output has the same articles as the input. Repeated IDs are counted in
+    # duplicates (they are always in the same shard)
+    out_file = os.path.join(shard_dir, 'outputs', shard['name'] + '.jsonl')
+    seen = set()
+    for article, record in itertools.zip_longest(
+            iter_articles(os.path.join(shard_dir, shard['path'])),
+            iter_articles(out_file)):
+        if (article is None) or (record is None) or (article['id'] != record['id']):
+            raise ValueError('{}: output does not match the input shard'.format(
+                out_file))
+        if article['id'] in seen:
+            duplicates[article['id']] = duplicates.get(article['id'], 1) + 1
+        seen.add(article['id'])
+        yield article['index'], record['id'], record['labels']
+
+
+def merge_shards(shard_dir, out_file, output_format='json'):
+    '''
+    DESCRIPTION: merge the outputs of all shards into one output file, in
+    input order (the same file as a run on the whole corpus).
+
+    Raises ValueError if a shard has no output, if an output does not match
+    its shard or if shards were annotated with different configurations.
+    The output file is only created if the merge succeeds.
+
+    Returns
+    -------
+    report : python dict
+        number of shards and articles, fingerprint of the configuration and
+        repeated article IDs (with their number of articles).
+    '''
+    manifest = read_manifest(shard_dir)
+    shards = manifest['shards']
+
+    missing = [shard['name'] for shard in shards if not os.path.exists(
+        os.path.join(shard_dir, 'outputs', shard['name'] + '.jsonl'))]
+    if missing:
+        raise ValueError('{} of {} shards have no output: {}'.format(
+            len(missing), len(shards), ', '.join(missing[:10])))
+    fingerprints = set()
+    for shard in shards:
+        with open(os.path.join(shard_dir, 'outputs', shard['name'] + '.meta.json'),
+                  encoding='utf-8') as f:
+            fingerprints.add(json.load(f)['fingerprint'])
+    if len(fingerprints) > 1:
+        raise ValueError('Shards were annotated with different dictionaries or '
+                         'configurations: {}'.format(sorted(fingerprints)))
+
+    duplicates = {}
+    n_articles = 0
+    tmp_file = tmp_path_of(out_file)
+    try:
+        with AnnotationWriter(tmp_file, output_format) as writer:
+            for _, _id, labels in heapq.merge(
+                    *[iter_shard_output(shard_dir, shard, duplicates)
+                      for shard in shards]):
+                writer.write(_id, labels)
+                n_articles = n_articles + 1
+        if n_articles != manifest['n_articles']:
+            raise ValueError('{} articles merged, {} in the manifest'.format(
+                n_articles, manifest['n_articles']))
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, out_file)
+
+    return {'shards': len(shards),
+            'articles': n_articles,
+            'fingerprint': fingerprints.pop() if fingerprints else None,
+            'duplicate_ids': duplicates}
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:48:12 2026
+
+Sorted span set used to store the predictions of a text, and compact
+representation of the final predictions
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class SpanSet():
+    '''
+    DESCRIPTION: set of text spans (off0, off1) with their predictions.
+
+    No stored span contains another one: a span is only added if no stored
+    span contains it, and stored spans contained in it are removed first
+    (see store_prediction). Then, sorting the spans by start also sorts
+    them by end, so containment queries are binary searches.
+    Every span stores one item (label, codes): one prediction per code.
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.items = []
+        self.n_predictions = 0
+
+    def __len__(self):
+        '''
+        DESCRIPTION: number of stored predictions.
+        '''
+        return self.n_predictions
+
+    def contains(self, off0, off1):
+        '''
+        DESCRIPTION: check whether a stored span contains (off0, off1).
+        O(log n).
+        '''
+        # Among spans starting before off0, the last one ends the latest
+        idx = bisect_right(self.starts, off0) - 1
+        return (idx >= 0) and (self.ends[idx] >= off1)
+
+    def remove_contained(self, off0, off1):
+        '''
+        DESCRIPTION: remove all the stored spans contained in (off0, off1).
+        They are contiguous: found with two binary searches.
+
+        Returns
+        -------
+        removed: list
+            tuples (off0, off1, label, codes) of the removed spans.
+        '''
+        lo = bisect_left(self.starts, off0)
+        hi = bisect_right(self.ends, off1)
+        if hi <= lo:
+            return []
+        removed = [(start, end, label, codes) for start, end, (label, codes)
+                   in zip(self.starts[lo:hi], self.ends[lo:hi], self.items[lo:hi])]
+        del self.starts[lo:hi]
+        del self.ends[lo:hi]
+        del self.items[lo:hi]
+        self.n_predictions = self.n_predictions - sum(len(x[3]) for x in removed)
+        return removed
+
+    def add(self, off0, off1, label, codes):
+        '''
+        DESCRIPTION: add a span and its predictions (one per code). The span
+        must not contain nor be contained in a stored span.
+        '''
+        idx = bisect_left(self.starts, off0)
+        self.starts.insert(idx, off0)
+        self.ends.insert(idx, off1)
+        self.items.insert(idx, (label, codes))
+        self.n_predictions = self.n_predictions + len(codes)
+
+    def predictions(self, txt):
+        '''
+        DESCRIPTION: stored predictions of the text txt, without duplicates 
+        and sorted by span (see Predictions).
+        '''
+        return merge_predictions(txt, [self])
+
+
+def merge_predictions(txt, span_sets):
+    '''
+    DESCRIPTION: predictions of the text txt stored in several SpanSets (one
+    per source dictionary, see find_annotations), without duplicates and 
+    sorted by span (see Predictions).
+    '''
+    label2id = {}
+    code2id = {}
+    # Duplicates are removed on integer keys
+    rows = set()
+    for span_set in span_sets:
+        for off0, off1, (label, codes) in zip(span_set.starts, span_set.ends,
+                                              span_set.items):
+            label_id = label2id.setdefault(label, len(label2id))
+            for code in codes:
+                rows.add((off0, off1, label_id, code2id.setdefault(code, len(code2id))))
+    return Predictions.from_ids(txt, rows, list(label2id), list(code2id))
+
+
+class Predictions():
+    '''
+    DESCRIPTION: predictions of a text, stored as integers. Offsets are kept
+    in typed arrays and labels and codes are interned: every prediction 
+    stores the position of its label in labels and of its code in codes.
+    Span texts are sliced from txt only when predictions are read.
+
+    Predictions are sorted by (span, off0, off1, label, code). They behave
+    as a read-only list of lists [span, off0, off1, label, code]; slicing
+    them returns a list.
+    '''
+
+    __slots__ = ('txt', 'starts', 'ends', 'label_ids', 'code_ids', 'labels',
+                 'codes')
+
+    def __init__(self, txt, starts, ends, label_ids, code_ids, labels, codes):
+        self.txt = txt
+        self.starts = starts
+        self.ends = ends
+        self.label_ids = label_ids
+        self.code_ids = code_ids
+        self.labels = labels
+        self.codes = codes
+
+    @classmethod
+    def from_ids(cls, txt, rows, labels, codes):
+        '''
+        DESCRIPTION: build the predictions of txt from unique tuples 
+        (off0, off1, label ID, code ID).
+        '''
+        rows = sorted(rows, key=lambda x: (txt[x[0]:x[1]], x[0], x[1],
+                                           labels[x[2]], codes[x[3]]))
+        return cls(txt, array('l', [x[0] for x in rows]), 
+                   array('l', [x[1] for x in rows]),
+                   array('l', [x[2] for x in rows]),
+                   array('l', [x[3] for x in rows]), labels, codes)
+
+    @classmethod
+    def from_rows(cls, txt, rows):
+        '''
+        DESCRIPTION: build the predictions of txt from lists 
+        [off0, off1, label, code] (see to_rows).
+        '''
+        label2id = {}
+        code2id = {}
+        rows = set((off0, off1, label2id.setdefault(label, len(label2id)),
+                    code2id.setdefault(code, len(code2id)))
+                   for off0, off1, label, code in rows)
+        return cls.from_ids(txt, rows, list(label2id), list(code2id))
+
+    def to_rows(self):
+        '''
+        DESCRIPTION: JSON serializable predictions, without span texts: 
+        lists [off0, off1, label, code].
+        '''
+        labels = self.labels
+        codes = self.codes
+        return [[off0, off1, labels[label_id], codes[code_id]] 
+                for off0, off1, label_id, code_id 
+                in zip(self.starts, self.ends, self.label_ids, self.code_ids)]
+
+    def unique_codes(self):
+        '''
+        DESCRIPTION: unique codes, in order of appearance. No span text is
+        sliced.
+        '''
+        return [self.codes[code_id] for code_id in dict.fromkeys(self.code_ids)]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            # A list, as slicing a list
+            return [self[j] for j in range(*i.indices(len(self)))]
+        off0 = self.starts[i]
+        off1 = self.ends[i]
+        return [self.txt[off0:off1], off0, off1, self.labels[self.label_ids[i]],
+                self.codes[self.code_ids[i]]]
+
+    def __iter__(self):
+        txt = self.txt
+        labels = self.labels
+        codes = self.codes
+        for off0, off1, label_id, code_id in zip(self.starts, self.ends, 
+                                                 self.label_ids, self.code_ids):
+            yield [txt[off0:off1], off0, off1, labels[label_id], codes[code_id]]
+
+    def __eq__(self, other):
+        if isinstance(other, (Predictions, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Predictions({})'.format(list(self))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:02:44 2026
+
+Incremental updates of a compiled dictionary
+
+Delta TSV: header line and columns action, code, span. Actions:
+    add      add the code to the span (a new annotation if the span is new)
+    remove   remove the code from the span (the annotation is removed when
+             it has no codes left)
+    recode   replace all the codes of the span by the code
+
+The updated artifact is the one compiled from the updated TSV: annotations
+keep their position (their ID), new annotations are appended in both.
+"""
+
+import csv
+import os
+import sys
+from utils.general_utils import normalize_str
+from utils.app_specific_utils import DEFAULT_LABEL, annot_tokens, index_tokens
+from utils.artifact_utils import (compile_dictionary, dictionary_fingerprint,
+                                  is_current_artifact, read_artifact,
+                                  write_artifact)
+from utils.matching_utils import (ngram_add, ngram_remove, trie_add,
+                                  trie_remove)
+
+DELTA_ACTIONS = ('add', 'remove', 'recode')
+
+
+def tsv_columns(tsv_path):
+    '''
+    DESCRIPTION: number of columns of a TSV with codes (those of its header).
+    '''
+    with open(tsv_path, encoding='utf-8', newline='') as f:
+        return len(next(csv.reader(f, delimiter='\t')))
+
+
+def read_delta(delta_path):
+    '''
+    DESCRIPTION: read a delta TSV (as read_tsv, codes are read as strings).
+    An empty file is an empty delta.
+
+    Returns
+    -------
+    delta: list
+        tuples (action, code, span), in file order.
+    '''
+    delta = []
+    with open(delta_path, encoding='utf-8', newline='') as f:
+        rows = csv.reader(f, delimiter='\t')
+        # Header
+        next(rows, None)
+        for row in rows:
+            if not ''.join(row).strip():
+                continue
+            if (len(row) != 3) or (row[0] not in DELTA_ACTIONS):
+                raise ValueError('{}:{}: expected action ({}), code and span'.format(
+                    delta_path, rows.line_num, '/'.join(DELTA_ACTIONS)))
+            delta.append((row[0], sys.intern(row[1]), row[2]))
+    return delta
+
+
+def convert_codes(id2annot_info, delta):
+    '''
+    DESCRIPTION: give the codes of a delta the type of the codes of the
+    dictionary. read_tsv converts codes to integers only if all of them are
+    integers, so the updated dictionary must be all integers or all strings:
+    a non-integer code in a dictionary of integer codes raises ValueError
+    (the original strings of its codes are lost), and a dictionary of string
+    codes whose codes become all integers is converted.
+
+    Returns
+    -------
+    delta: list
+        tuples (action, code, span) with converted codes.
+    '''
+    int_codes = any(isinstance(info[2][0], int) for info in id2annot_info
+                    if info is not None)
+    if not int_codes:
+        return delta
+    try:
+        return [(action, int(code), span) for action, code, span in delta]
+    except ValueError:
+        raise ValueError('Non-integer code in a delta of a dictionary with ' +
+                         'integer codes: edit and compile the TSV instead')
+
+
+def int_codes_if_possible(id2annot_info):
+    '''
+    DESCRIPTION: convert string codes to integers, in place, if all of
+    them are integers (see read_tsv).
+    '''
+    try:
+        code2value = dict((code, int(code)) for info in id2annot_info
+                          if info is not None for code in info[2]
+                          if not isinstance(code, int))
+    except ValueError:
+        return
+    if not code2value:
+        return
+    for annot_id, info in enumerate(id2annot_info):
+        if info is not None:
+            codes = [code2value.get(code, code) for code in info[2]]
+            id2annot_info[annot_id] = info[:2] + (codes,) + info[3:]
+
+
+def _index_annotation(payload, annot_id, min_upper, add):
+    # Add (or remove) one annotation to (or from) the token index, the
+    # token frequencies, the term trie and the n-gram index
+    annot, _, _, _, n_words, annot_processed = payload['id2annot_info'][annot_id]
+    token2annot_ids = payload['token2annot_ids']
+    token2freq = payload['token2freq']
+    tokens = annot_tokens(annot, min_upper)
+    if add:
+        for token in dict.fromkeys(tokens):
+            token2freq[token] = token2freq.get(token, 0) + 1
+        for token in index_tokens(tokens, n_words, token2freq, min_upper):
+            token2annot_ids.setdefault(token, []).append(annot_id)
+        if n_words >= 2:
+            trie_add(payload['term_trie'], annot_id, annot_processed)
+            ngram_add(payload['ngram_index'], annot_id, annot_processed)
+    else:
+        # The anchor may have been chosen with other frequencies: look for
+        # the annotation under all its tokens
+        for token in dict.fromkeys(tokens):
+            token2freq[token] = token2freq[token] - 1
+            if token2freq[token] == 0:
+                del token2freq[token]
+            annot_ids = token2annot_ids.get(token)
+            if (annot_ids is not None) and (annot_id in annot_ids):
+                annot_ids.remove(annot_id)
+                if not annot_ids:
+                    del token2annot_ids[token]
+        if n_words >= 2:
+            trie_remove(payload['term_trie'], annot_id, annot_processed)
+            ngram_remove(payload['ngram_index'], annot_id, annot_processed)
+
+
+def apply_delta(payload, delta, min_upper):
+    '''
+    DESCRIPTION: apply a delta to the payload of a compiled dictionary, in
+    place. The cost depends on the size of the delta, not on the size of
+    the dictionary.
+
+    Removed annotations leave a None in id2annot_info, so the IDs of the
+    others do not change. New annotations get new IDs at the end. Codes are
+    converted as read_tsv does (see convert_codes).
+
+    Parameters
+    ----------
+    payload: python dict
+        payload of a compiled dictionary (see compile_dictionary).
+    delta: list
+        tuples (action, code, span) (see read_delta).
+    min_upper: int.
+
+    Returns
+    -------
+    summary: python dict
+        number of annotations added, removed and recoded.
+    '''
+    id2annot_info = payload['id2annot_info']
+    annot2id = payload['annot2id']
+    summary = {'added': 0, 'removed': 0, 'recoded': 0, 'ignored': 0}
+    delta = convert_codes(id2annot_info, delta)
+
+    for action, code, span in delta:
+        annot_id = annot2id.get(span)
+        if annot_id is None:
+            if action == 'remove':
+                summary['ignored'] = summary['ignored'] + 1
+                continue
+            # New annotation
+            annot_id = len(id2annot_info)
+            id2annot_info.append((span, DEFAULT_LABEL, [code], len(span),
+                                  len(span.split()),
+                                  normalize_str(span, min_upper)))
+            annot2id[span] = annot_id
+            _index_annotation(payload, annot_id, min_upper, add=True)
+            summary['added'] = summary['added'] + 1
+            continue
+
+        annot, label, codes, n_chars, n_words, annot_processed = \
+            id2annot_info[annot_id]
+        if action == 'add':
+            if code in codes:
+                summary['ignored'] = summary['ignored'] + 1
+                continue
+            codes = codes + [code]
+        elif action == 'remove':
+            if code not in codes:
+                summary['ignored'] = summary['ignored'] + 1
+                continue
+            codes = [x for x in codes if x != code]
+        else:
+            codes = [code]
+        summary['recoded'] = summary['recoded'] + 1
+
+        if codes:
+            id2annot_info[annot_id] = (annot, label, codes, n_chars, n_words,
+                                       annot_processed)
+        else:
+            _index_annotation(payload, annot_id, min_upper, add=False)
+            id2annot_info[annot_id] = None
+            del annot2id[span]
+            summary['recoded'] = summary['recoded'] - 1
+            summary['removed'] = summary['removed'] + 1
+
+    int_codes_if_possible(id2annot_info)
+    return summary
+
+
+def apply_delta_tsv(tsv_path, delta, id2annot_info, annot2id, n_annots,
+                    out_tsv_path):
+    '''
+    DESCRIPTION: write the TSV of a dictionary updated with apply_delta, so
+    that compiling it gives the same annotations, in the same order (IDs),
+    with the same codes. The first line (header) and the rows of the spans
+    not in the delta are copied. The rows of an updated span are replaced
+    by one row per code where its first row was, those of a removed span
+    are dropped, and new spans (IDs from n_annots on) are appended in ID
+    order.
+
+    Parameters
+    ----------
+    delta: list
+        tuples (action, code, span) applied.
+    id2annot_info, annot2id: list, python dict
+        annotation information and IDs of the updated payload.
+    n_annots: int
+        length of id2annot_info before the update.
+    '''
+    updated = set(span for _, _, span in delta)
+
+    def code_rows(span):
+        return ''.join('{}\t{}\n'.format(code, span)
+                       for code in id2annot_info[annot2id[span]][2])
+
+    tmp_path = out_tsv_path + '.tmp'
+    with open(tsv_path, encoding='utf-8', newline='') as f_in, \
+         open(tmp_path, 'w', encoding='utf-8', newline='') as f_out:
+        f_out.write(next(f_in))
+        written = set()
+        for line in f_in:
+            row = next(csv.reader([line], delimiter='\t'), None)
+            if (row is None) or (len(row) != 2) or (row[1] not in updated):
+                f_out.write(line if line.endswith('\n') else line + '\n')
+                continue
+            span = row[1]
+            # Removed, or removed and added again (at the end)
+            if (span in written) or (annot2id.get(span, n_annots) >= n_annots):
+                continue
+            written.add(span)
+            f_out.write(code_rows(span))
+        for info in id2annot_info[n_annots:]:
+            if info is not None:
+                f_out.write(code_rows(info[0]))
+    os.replace(tmp_path, out_tsv_path)
+
+
+def update_dictionary(tsv_path, artifact_path, delta_path, min_upper,
+                      out_tsv_path=None):
+    '''
+    DESCRIPTION: apply a delta TSV to a compiled dictionary and to its TSV.
+    The artifact is compiled first if it is missing or outdated.
+
+    Parameters
+    ----------
+    tsv_path: str
+        path to input TSV with codes. It must have 2 columns (code, span):
+        ValueError is raised otherwise, before anything is changed.
+    artifact_path: str
+        path to the compiled dictionary of tsv_path. It is overwritten.
+    delta_path: str
+        path to delta TSV (see read_delta).
+    min_upper: int.
+    out_tsv_path: str
+        path to the updated TSV. If None, tsv_path is overwritten.
+
+    Returns
+    -------
+    fingerprint: str
+        fingerprint of the updated dictionary (see dictionary_fingerprint).
+        Runs with the updated TSV use the updated artifact, and cached
+        results of the old dictionary are not used (see cache_fingerprint).
+    summary: python dict
+        see apply_delta.
+    '''
+    # Rows are rewritten and added as (code, span), and new annotations get
+    # DEFAULT_LABEL: other layouts would be corrupted
+    n_columns = tsv_columns(tsv_path)
+    if n_columns != 2:
+        raise ValueError('{}: only 2-column TSVs (code, span) can be updated, '
+                         'found {} columns'.format(tsv_path, n_columns))
+    out_tsv_path = tsv_path if out_tsv_path is None else out_tsv_path
+    delta = read_delta(delta_path)
+
+    if not is_current_artifact(tsv_path, min_upper, artifact_path):
+        compile_dictionary(tsv_path, min_upper, artifact_path)
+    payload = read_artifact(artifact_path)
+    n_annots = len(payload['id2annot_info'])
+    summary = apply_delta(payload, delta, min_upper)
+
+    apply_delta_tsv(tsv_path, delta, payload['id2annot_info'],
+                    payload['annot2id'], n_annots, out_tsv_path)
+    fingerprint = dictionary_fingerprint(out_tsv_path, min_upper)
+    payload['tsv_path'] = os.path.abspath(out_tsv_path)
+    write_artifact(payload, fingerprint, artifact_path)
+
+    return fingerprint, summary